@@ -1,5 +1,14 @@
+import json
 from time import time
 from utility.printable import Printable
+from utility.difficulty import DEFAULT_DIFFICULTY, valid_difficulty
+from utility.hash_util import hash_block
+from utility.merkle import merkle_root
+from transaction import Transaction
+
+# Version of newly mined blocks. Version 1 blocks (e.g. the genesis block) hash and prove all their transactions,
+# version 2 blocks only their header, which commits to the transactions through a Merkle root.
+BLOCK_VERSION = 2
 
 # Creating a block, where by every instance of the block will be independent, hence __init__
 class Block(Printable):
@@ -11,10 +20,109 @@ class Block(Printable):
         :timestamp: The timestamp of the block (automatically generated by default).
         :transactions: A list of transactions which are included in the block.
         :proof: The proof of work number that yielded this block.
+        :difficulty: The number of leading zero bits the proof of work hash of this block has.
+        :version: The format of this block (see BLOCK_VERSION).
+        :merkle_root: The Merkle root over the ids of the transactions (None for version 1 blocks).
     """
-    def __init__(self, index, previous_hash, transactions, proof, time=time()):
+    # The memoized hash is a private slot, so it is neither printed nor part of to_dict (which is hashed and saved)
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'transactions', 'proof', 'difficulty', 'version', 'merkle_root', '_cached_hash')
+
+    def __init__(self, index, previous_hash, transactions, proof, timestamp=None, difficulty=DEFAULT_DIFFICULTY, version=1, merkle_root=None):
+        self.version = version
         self.index = index
         self.previous_hash = previous_hash
-        self.timestamp = time
+        # The timestamp is taken when the block is created (not once when this module is imported)
+        self.timestamp = time() if timestamp is None else timestamp
         self.transactions = transactions
         self.proof = proof
+        self.difficulty = difficulty
+        if version >= 2 and merkle_root is None:
+            merkle_root = self.compute_merkle_root()
+        self.merkle_root = merkle_root
+
+    def __setattr__(self, name, value):
+        # Blocks are immutable by convention, but if a field is changed the hash has to be calculated again
+        object.__setattr__(self, '_cached_hash', None)
+        object.__setattr__(self, name, value)
+
+    def __add_version(self, fields):
+        # Version 1 blocks are saved and sent without the new fields, as they were before versions existed
+        if self.version >= 2:
+            fields['version'] = self.version
+            fields['merkle_root'] = self.merkle_root
+        return fields
+
+    def to_dict(self):
+        """Converts this block (including its transactions) into a dictionary (used for saving and sending it)."""
+        return self.__add_version({
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': [tx.to_dict() for tx in self.transactions],
+            'proof': self.proof,
+            'difficulty': self.difficulty
+        })
+
+    @classmethod
+    def from_dict(cls, block):
+        """Create a block from a dictionary created by to_dict.
+
+        Raises a ValueError if the dictionary is malformed (e.g. a block of a peer node with missing fields or an
+        index which is not an integer).
+        """
+        try:
+            # Blocks of older nodes carry no difficulty and were mined with the default difficulty
+            converted_block = cls(block['index'], block['previous_hash'], [Transaction.from_dict(tx) for tx in block['transactions']], block['proof'], block['timestamp'], block.get('difficulty', DEFAULT_DIFFICULTY),
+                                  block.get('version', 1), block.get('merkle_root'))
+        except (KeyError, TypeError, AttributeError) as error:
+            raise ValueError('Malformed block: {!r}'.format(error))
+        # Blocks are stored and looked up by their index, so 1.0 must not pass for 1
+        for field in ('index', 'difficulty', 'version'):
+            value = getattr(converted_block, field)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError('The {} of a block must be an integer, got {!r}'.format(field, value))
+        if not valid_difficulty(converted_block.difficulty):
+            raise ValueError('Invalid difficulty {!r}'.format(converted_block.difficulty))
+        return converted_block
+
+    def compute_merkle_root(self):
+        """Return the Merkle root over the ids of the transactions of this block (see utility.merkle)."""
+        return merkle_root([tx.id for tx in self.transactions])
+
+    def header_prefix(self):
+        """Return the header of a version 2 block without the proof, which is appended to it for the proof of work.
+
+        The proof of work and the hash of such a block are the SHA256 of the prefix followed by the proof number,
+        so both have a constant size no matter how many transactions the block contains.
+        """
+        header = {
+            'version': self.version,
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'merkle_root': self.merkle_root,
+            'timestamp': self.timestamp,
+            'difficulty': self.difficulty
+        }
+        return json.dumps(header, sort_keys=True, separators=(',', ':')).encode('utf8')
+
+    def to_bytes(self):
+        """Return the canonical byte representation of this block (compact JSON with sorted keys)."""
+        return json.dumps(self.to_dict(), sort_keys=True, separators=(',', ':')).encode('utf8')
+
+    def to_header(self):
+        """Return the fields of this block except the transactions, plus its hash."""
+        return self.__add_version({
+            'index': self.index,
+            'hash': self.hash,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'proof': self.proof,
+            'difficulty': self.difficulty
+        })
+
+    @property
+    def hash(self):
+        """The hash of this block (calculated once and memoized)."""
+        if self._cached_hash is None:
+            object.__setattr__(self, '_cached_hash', hash_block(self))
+        return self._cached_hash
@@ -0,0 +1,67 @@
+from utility.binary_codec import encode_transaction
+
+
+# Maximum number of open transactions put into one block (the reward transaction is not counted)
+MAX_BLOCK_TRANSACTIONS = 1000
+# Maximum number of bytes the open transactions of one block take up when encoded (see utility.binary_codec)
+MAX_BLOCK_SIZE = 1000000
+# Orders in which open transactions are picked for a new block
+TEMPLATE_POLICIES = ('arrival', 'amount', 'fee')
+
+
+class TemplateBuilder:
+    """Picks the open transactions which go into a new block, so blocks stay within a size limit.
+
+    Transactions are taken in the order of the policy until the block is full. Transactions which are too large for
+    the remaining space are skipped in favour of smaller ones, and everything which is left over stays open for later
+    blocks.
+
+    Policies:
+        :arrival: Oldest transactions first.
+        :amount: Largest amounts first.
+        :fee: Highest fees per encoded byte first.
+
+    Attributes:
+        :policy: One of TEMPLATE_POLICIES.
+        :max_transactions: The maximum number of open transactions in a block.
+        :max_size: The maximum number of bytes of the encoded open transactions in a block.
+    """
+    def __init__(self, policy='arrival', max_transactions=MAX_BLOCK_TRANSACTIONS, max_size=MAX_BLOCK_SIZE):
+        if policy not in TEMPLATE_POLICIES:
+            raise ValueError('Unknown template policy {!r}, expected one of {}'.format(policy, TEMPLATE_POLICIES))
+        self.policy = policy
+        self.max_transactions = max_transactions
+        self.max_size = max_size
+
+    @staticmethod
+    def size(transaction):
+        """Return the number of bytes a transaction takes up in a block."""
+        return len(encode_transaction(transaction))
+
+    def select(self, transactions):
+        """Return the transactions for a new block in the order they are put into it.
+
+        Arguments:
+            :transactions: The open transactions in arrival order.
+        """
+        sized = [(tx, self.size(tx)) for tx in transactions]
+        # sorted is stable, so transactions which rank the same keep their arrival order
+        if self.policy == 'amount':
+            sized = sorted(sized, key=lambda entry: -entry[0].amount)
+        elif self.policy == 'fee':
+            sized = sorted(sized, key=lambda entry: -entry[0].fee / entry[1])
+        selected = []
+        remaining = self.max_size
+        for tx, size in sized:
+            if len(selected) >= self.max_transactions:
+                break
+            if size <= remaining:
+                selected.append(tx)
+                remaining -= size
+        return selected
+
+    def exceeds_limits(self, transactions):
+        """Return True if a block with these transactions (without the reward transaction) would be too large."""
+        if len(transactions) > self.max_transactions:
+            return True
+        return sum(self.size(tx) for tx in transactions) > self.max_size
@@ -1,125 +1,287 @@
-import functools
 import hashlib
 from collections import OrderedDict
-import json
 import pickle
+import threading
 import requests
-from utility.hash_util import hash_block
-from utility.verification import Verification
-from block import Block
+from concurrent.futures import ThreadPoolExecutor, wait
+from utility.verification import Verification, MINING_REWARD
+from utility.difficulty import TARGET_BLOCK_TIME, VALIDATION_WINDOW, next_difficulty, valid_timestamp, chain_work, follows_legacy_rules
+from utility.rwlock import ReadWriteLock
+from utility.merkle import merkle_proof
+from utility.binary_codec import BINARY_CONTENT_TYPE, encode_block, decode_stored_block, encode_transaction, encode_transactions, decode_blocks
+from block import Block, BLOCK_VERSION
+from chain_view import ChainView, ForkView, StoredChain
 from transaction import Transaction
-from wallet import Wallet
+from ledger import Ledger
+from mempool import Mempool
+from storage import BlockStorage
+from miner import Miner
+from block_template import TemplateBuilder
+from broadcast import Broadcaster
 
 
 
 
-# Reward given to miners for creating a new block
-MINING_REWARD = 10
+# Number of headers or blocks requested from a peer node at once while resolving conflicts
+SYNC_PAGE_SIZE = 100
+# Seconds a peer node gets to deliver and validate its chain while resolving conflicts
+RESOLVE_TIMEOUT = 30
+# Number of new blocks after which a snapshot of the balances is stored
+SNAPSHOT_INTERVAL = 100
 
 class Blockchain:
     """The Blockchain class manages the chain of blocks as well as open transactions and the node on which it's running.
 
+    A Blockchain can be shared by the threads of a multi-threaded server: reading methods hold a shared read lock,
+    methods which change the chain, open transactions or peer nodes hold an exclusive write lock. Mining, verifying
+    and broadcasting happen outside the write lock, and the result is only committed if the chain did not change
+    in the meantime.
+
     Attributes:
-        :chain: The list of blocks.
-        :open_transactions (private): The list of open transactions.
+        :chain: The list of blocks (a StoredChain if the chain is loaded lazily).
+        :hash_index (private): Mapping of block hash to the height of the block in the chain (built on first use if the chain is loaded lazily).
+        :mempool (private): The open transactions, indexed by transaction id and sender.
         :public_key: The connected node (which runs the blockchain).
+        :ledger (private): The balance index which is updated whenever blocks or open transactions change.
+        :storage (private): The append-only store the chain, open transactions and peer nodes are persisted in.
+        :miner: The miner which searches the proof of work for new blocks.
+        :template: Picks the open transactions which go into a new block and limits the size of blocks.
+        :block_time: The targeted number of seconds between two blocks the difficulty is adjusted towards.
+        :broadcaster: Sends new transactions and blocks to the peer nodes.
+        :last_resolve_report: Which peer nodes responded, timed out, were unreachable or sent an invalid chain in the last resolve.
+        :lazy: Whether older blocks are left in the block store and only decoded when they are accessed (see StoredChain).
+        :checkpoints: Mapping of height to the trusted hash of the block at that height (see Verification.verify_chain).
+        :snapshot_height (private): The height of the chain when the last snapshot of the balances was stored.
+        :lock (private): The ReadWriteLock guarding the chain, open transactions, peer nodes and balance index.
+        :mining_lock (private): Lets only one thread mine at a time.
     
     """
-    def __init__(self, public_key,node_id):
+    def __init__(self, public_key,node_id, miner=None, block_time=TARGET_BLOCK_TIME, broadcaster=None, lazy=False, checkpoints=None, template=None):
         """Constructor of the Blockchain class."""
+        self.__lock = ReadWriteLock()
+        self.__mining_lock = threading.Lock()
         # Starting block for the blockchain
         genesis_block = Block(0,'',[],100, 0)
         # Initializing empty blockchain list
         self.chain = [genesis_block]
         # Unhandled transactions
-        self.__open_transactions = []
+        self.__mempool = Mempool()
         self.public_key = public_key
         self.__peer_nodes = set()
         self.node_id = node_id
         self.resolve_conflicts = False
+        self.last_resolve_report = None
+        self.miner = miner or Miner()
+        self.template = template or TemplateBuilder()
+        self.block_time = block_time
+        self.broadcaster = broadcaster or Broadcaster()
+        self.lazy = lazy
+        self.checkpoints = dict(checkpoints or {})
+        self.__snapshot_height = 0
+        self.__ledger = Ledger()
+        self.__storage = BlockStorage(node_id)
         self.load_data()
     
     @property
     def chain(self):
-        """Convert the chain attribute into a property with a getter and setter"""
-        return self.__chain[:]
+        """Convert the chain attribute into a property with a getter and setter (returns a full copy of the chain)"""
+        with self.__lock.read():
+            return self.__chain[:]
+
+
+    @property
+    def chain_view(self):
+        """A read-only view of the chain which does not copy it (see ChainView)."""
+        return ChainView(self.__chain, self.__lock)
+
+
+    @property
+    def tip(self):
+        """The last block of the chain."""
+        with self.__lock.read():
+            return self.__chain[-1]
+
+
+    @property
+    def height(self):
+        """The number of blocks in the chain."""
+        with self.__lock.read():
+            return len(self.__chain)
   
     @chain.setter
     def chain(self, val):
         """Setter of chain property"""
-        self.__chain = val
+        with self.__lock.write():
+            self.__chain = val
+            self.__hash_index = {block.hash: height for height, block in enumerate(val)}
+
+
+    def get_block_height(self, block_hash):
+        """Return the height of the block with a hash or None if the block is not part of the chain."""
+        with self.__lock.read():
+            if self.__hash_index is None:
+                self.__hash_index = {block.hash: height for height, block in enumerate(self.__chain)}
+            return self.__hash_index.get(block_hash)
     
+    def set_public_key(self, public_key):
+        """Switch the wallet this node mines for (e.g. after keys were created or loaded).
+
+        The blockchain keeps running, so mining jobs and the block store are not affected.
+        """
+        with self.__lock.write():
+            self.public_key = public_key
+
+    def get_inclusion_proof(self, tx_id, height=None):
+        """Return the block which contains a transaction, the position of the transaction and its Merkle proof.
+
+        Arguments:
+            :tx_id: The id of the transaction (see Transaction.id).
+            :height: The height of the block. If it is not given, the chain is searched from the tip backwards.
+
+        Returns None if the transaction is not found. The proof is None for version 1 blocks (they have no Merkle root).
+        """
+        with self.__lock.read():
+            if height is None:
+                heights = range(len(self.__chain) - 1, -1, -1)
+            else:
+                heights = [height] if 0 <= height < len(self.__chain) else []
+            for block_height in heights:
+                block = self.__chain[block_height]
+                tx_ids = [tx.id for tx in block.transactions]
+                if tx_id in tx_ids:
+                    position = tx_ids.index(tx_id)
+                    proof = merkle_proof(tx_ids, position) if block.version >= 2 else None
+                    return block, position, proof
+        return None
+
     def get_open_transactions(self):
-        """Returns a copy of the open transactions list."""
-        return self.__open_transactions[:]
+        """Returns a list of the open transactions."""
+        with self.__lock.read():
+            return self.__mempool.get_transactions()
+
+
+    @property
+    def mempool_version(self):
+        """Changes whenever open transactions are added or removed (see Mempool.version)."""
+        with self.__lock.read():
+            return self.__mempool.version
+
+
+    def has_open_transaction(self, sender, recipient, signature, amount, fee=0):
+        """Return True if a transaction is already among the open transactions."""
+        with self.__lock.read():
+            return Transaction(sender, recipient, signature, amount, fee) in self.__mempool
 
     def load_data(self):
-        """Initialize blockchain + open transactions data from a file."""
+        """Initialize blockchain + open transactions data from the block store."""
+        with self.__lock.write():
+            try:
+                if self.lazy:
+                    if not len(self.__storage):
+                        # An empty store gets the genesis block first, so the whole chain can be read from the store
+                        self.save_blocks()
+                    self.__chain = StoredChain(self.__storage, decode_stored_block)
+                    self.__hash_index = None
+                else:
+                    updated_blockchain = [decode_stored_block(record) for record in self.__storage.read_blocks()]
+                    if updated_blockchain:
+                        self.chain = updated_blockchain # access without double underscore to trigger property setter
+                self.__mempool = Mempool([Transaction.from_dict(tx) for tx in self.__storage.load_open_transactions()])
+                self.__peer_nodes = set(self.__storage.load_peer_nodes())
+            except (IOError, IndexError, ValueError):
+                pass
+            self.__restore_ledger()
+
+
+    def __restore_ledger(self):
+        """Rebuild the balance index, starting from the stored snapshot if it was taken on the current chain."""
+        snapshot = self.__storage.load_snapshot()
         try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='r') as f:
-                # file_content = pickle.loads(f.read())
-                file_content = f.readlines()
-                # blockchain = file_content['chain']
-                # open_transactions = file_content['ot']
-                # # First line is blockchain, Second is transaction data
-                blockchain = json.loads(file_content[0][:-1]) #avoid \n character
-                # Need to convert the loaded data because Transactions should use an Ordered Dict
-                updated_blockchain = []
-                for block in blockchain:
-                    converted_tx = [Transaction(tx['sender'], tx['recipient'],tx['signature'] , tx['amount']) for tx in block['transactions']]
-                    
-                    updated_block = Block(block['index'], block['previous_hash'], converted_tx, block['proof'], block['timestamp'])
-                    updated_blockchain.append(updated_block)
-                    
-                self.chain = updated_blockchain # access without double underscore to trigger property setter
-                open_transactions = json.loads(file_content[1][:-1])
-                # Need to convert the loaded data because Transactions should use an Ordered Dict
-                updated_transactions = []
-                for tx in open_transactions:
-                    updated_transaction = Transaction(tx['sender'], tx['recipient'],tx['signature'] , tx['amount'])
-                    updated_transactions.append(updated_transaction)
-                self.__open_transactions = updated_transactions
-                peer_nodes = json.loads(file_content[2])
-                self.__peer_nodes = set(peer_nodes)
-        except (IOError, IndexError):
-            pass
+            height = snapshot['height']
+            if 0 < height <= len(self.__chain) and self.__chain[height - 1].hash == snapshot['hash']:
+                # Only the blocks after the snapshot have to be replayed
+                blocks = (self.__chain[index] for index in range(height, len(self.__chain)))
+                self.__ledger.restore(snapshot['balances'], blocks, self.__mempool)
+                self.__snapshot_height = height
+                return
+        except (TypeError, KeyError, ValueError):
+            pass # the snapshot is missing or unusable
+        self.__ledger.rebuild(self.__chain, self.__mempool)
 
 
     def save_data(self):
-        """Save Blockchain + open transaction snapshot to a file."""
-        try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='w') as f:
-                saveable_chain = [block.__dict__ for block in [Block(block_el.index, block_el.previous_hash, [tx.__dict__ for tx in block_el.transactions] ,block_el.proof, block_el.timestamp) for block_el in self.__chain]]
-                f.write(json.dumps(saveable_chain))
-                f.write('\n')
-                saveable_tx = [tx.__dict__ for tx in self.__open_transactions]
-                f.write(json.dumps(saveable_tx))
-                f.write('\n')
-                f.write(json.dumps(list(self.__peer_nodes)))
-                # save_data = {
-                #     'chain':blockchain,
-                #     'ot': open_transactions
-                # }
-                # f.write(pickle.dumps(save_data))
-        except (IOError, IndexError):
-            print('WARNING! Saving Failed!')
-
-
-
-    def proof_of_work(self):
+        """Save blocks which are not stored yet, the open transactions and the peer nodes."""
+        with self.__lock.write():
+            self.save_blocks()
+            self.save_open_transactions()
+            self.save_peer_nodes()
+
+
+    def save_blocks(self):
+        """Append the blocks which are not in the block store yet."""
+        with self.__lock.write():
+            try:
+                for block_el in self.__chain[len(self.__storage):]:
+                    self.__storage.append_block(encode_block(block_el))
+                if isinstance(self.__chain, StoredChain):
+                    self.__chain.release(len(self.__storage))
+                if len(self.__storage) - self.__snapshot_height >= SNAPSHOT_INTERVAL:
+                    self.save_snapshot()
+            except (IOError, IndexError):
+                print('WARNING! Saving blocks failed!')
+
+
+    def save_snapshot(self):
+        """Store the confirmed balances together with the height and hash of the block they were taken at."""
+        with self.__lock.write():
+            snapshot = {'height': len(self.__chain), 'hash': self.__chain[-1].hash, 'balances': self.__ledger.balances()}
+            try:
+                self.__storage.save_snapshot(snapshot)
+                self.__snapshot_height = snapshot['height']
+            except IOError:
+                print('WARNING! Saving snapshot failed!')
+
+
+    def save_open_transactions(self):
+        """Replace the stored open transactions with the current ones."""
+        with self.__lock.write():
+            try:
+                self.__storage.save_open_transactions([tx.to_dict() for tx in self.__mempool])
+            except (IOError, IndexError):
+                print('WARNING! Saving open transactions failed!')
+
+
+    def save_peer_nodes(self):
+        """Replace the stored peer nodes with the current ones."""
+        with self.__lock.write():
+            try:
+                self.__storage.save_peer_nodes(self.__peer_nodes)
+            except (IOError, IndexError):
+                print('WARNING! Saving peer nodes failed!')
+
+
+
+    def proof_of_work(self, transactions=None):
         """Generate a proof of work for the open transactions, the hash of the previous block and a random number (which is guessed until it fits)"""
-        last_block = self.__chain[-1]
-        last_hash = hash_block(last_block)
-        proof = 0
-        # Try different PoW numbers and return the first valid one
-        while not Verification.valid_proof(self.__open_transactions, last_hash, proof):
-            proof += 1
-        return proof
+        with self.__lock.read():
+            if transactions is None:
+                transactions = self.__mempool.get_transactions()
+            last_block = self.__chain[-1]
+            last_hash = last_block.hash
+            difficulty = self.get_difficulty()
+        # Try different PoW numbers and return the first valid one (without blocking other threads)
+        return self.miner.proof_of_work(transactions, last_hash, difficulty)
+
+
+    def get_difficulty(self):
+        """Return the difficulty (leading zero bits) the next block has to be mined with."""
+        with self.__lock.read():
+            return next_difficulty(self.__chain, self.block_time)
 
 
 
     def get_balance(self, sender=None):
-        """Calculate and return the balance for a participant.
+        """Return the balance for a participant from the balance index.
         """
         if sender is None:
             if self.public_key is None:
@@ -127,171 +289,443 @@ class Blockchain:
             participant = self.public_key
         else:
             participant = sender
-        # Fetch a list of all sent coin amounts for the given person (empty lists are returned if the person was NOT the sender)
-        # This fetches sent amounts of transactions that were already included in blocks of the blockchain
-        tx_sender = [[tx.amount for tx in block.transactions if tx.sender == participant] for block in self.__chain]
-        # Fetch a list of all sent coin amounts for the given person (empty lists are returned if the person was NOT the sender)
-        # This fetches sent amounts of open transactions (to avoid double spending)
-        open_tx_sender = [tx.amount for tx in self.__open_transactions if tx.sender == participant]
-        tx_sender.append(open_tx_sender)
-        print(tx_sender)
-        # Calculate the total amount of coins sent
-        amount_sent = functools.reduce(lambda tx_sum, tx_amt: tx_sum+ sum(tx_amt) if len(tx_amt) > 0 else tx_sum+0, tx_sender, 0)
+        with self.__lock.read():
+            return self.__ledger.get_balance(participant)
 
-        # This fetches received coin amounts of transactions that were already included in blocks of the blockchain
-        # Open transactions are ignored here because one should not be able to spend coins before the transaction was confirmed + included in a block
-        tx_recipient = [[tx.amount for tx in block.transactions if tx.recipient == participant] for block in self.__chain]
 
-        amount_received = functools.reduce(lambda tx_sum, tx_amt: tx_sum+ sum(tx_amt) if len(tx_amt) > 0 else tx_sum+0, tx_recipient, 0)
-
-        # Return the total balance
-        return amount_received - amount_sent
+    def verify_balances(self):
+        """Check the balance index against a full rescan of the chain and open transactions."""
+        with self.__lock.read():
+            return self.__ledger.verify(self.__chain, self.__mempool)
 
 
     def get_last_blockchain_value(self):
         """Returns the last value of the current blockchain"""
-        if len(self.__chain) < 1:
-            return None
-        return self.__chain[-1]
+        with self.__lock.read():
+            if len(self.__chain) < 1:
+                return None
+            return self.__chain[-1]
 
 
-    def add_transaction(self, recipient, sender, signature, amount=1.0, is_receiving=False):
+    def add_transaction(self, recipient, sender, signature, amount=1.0, is_receiving=False, fee=0):
         """Append new value as well as the last blockchain value to the blockchain
 
         Arguments:
             :sender: Sender of coins in transaction.
             :recipient: Receiver of coins in transaction.
             :amount: Amount of coins sent in transaction (default = 1.0)
+            :fee: Coins paid to the miner of the transaction on top of the amount (default = 0)
         """
         # transaction = {'sender':sender, 
         #     'recipient':recipient, 
         #     'amount':amount}
         # if self.public_key == None:
         #     return False
-        transaction = Transaction(sender, recipient, signature, amount)
-        if Verification.verify_transaction(transaction, self.get_balance):
-            self.__open_transactions.append(transaction)
-            self.save_data()
-            if not is_receiving:
-                # Only broadcasting to peer nodes if on the original node that created the transaction. 
-                # This prevents a chain of infinite requests occuring and only getting back one response
-                for node in self.__peer_nodes:
-                    # send an http request to communicate with the nodes
-                    url = 'http://{}/broadcast-transaction'.format(node)
-                    try:
-                        response = requests.post(url, json={'sender': sender, 'recipient': recipient, 'amount':amount, 'signature': signature})
-                        if response.status_code == 400 or response.status_code == 500:
-                            print('Transaction declined, needs resolving.')
-                            return False
-                    except requests.exceptions.ConnectionError:
-                        continue # in case could not broadcast to node (e.g. no internet) skip to the next node
-            return True
-        return False
-
-
-    def mine_block(self):
-        """Create a new block and add open transactions to it."""
-        if self.public_key is None:
-            return None
-        # Fetch the currently last block of the blockchain
-        last_block = self.__chain[-1]
-        # Hash the last block (=> to be able to compare it to the stored hash value)
-        hashed_block = hash_block(last_block)
-        proof = self.proof_of_work()
-        # Miners should be rewarded, so let's create a reward transaction
-        # reward_transaction = {
-        #     'sender':'MINING',
-        #     'recipient':owner,
-        #     'amount': MINING_REWARD
-        # }
-        
-        reward_transaction = Transaction('MINING', self.public_key, '' ,MINING_REWARD)
-        # Copy transaction instead of manipulating the original open_transactions list
-        # This ensures that if mining should fail, the reward transaction would be prevented from being stored in the open transactions
-        copied_transactions = self.__open_transactions[:]
-        for tx in copied_transactions:
-            if not Wallet.verify_transaction(tx):
-                return None
-        copied_transactions.append(reward_transaction) # adding mined block to system
-        block = Block(len(self.__chain), hashed_block, copied_transactions, proof)
+        transaction = Transaction(sender, recipient, signature, amount, fee)
+        if fee < 0:
+            return False
+        # The signature is checked before taking the write lock, so other threads are not held up by it
+        if not Verification.verify_transaction(transaction, self.get_balance, check_funds=False):
+            return False
+        with self.__lock.write():
+            if transaction in self.__mempool:
+                # The same transaction is relayed by several peers
+                return False
+            if self.__ledger.get_balance(sender) < transaction.cost:
+                return False
+            evicted = self.__mempool.add(transaction)
+            self.__ledger.add_pending(transaction)
+            for tx in evicted:
+                self.__ledger.remove_pending(tx)
+            self.save_open_transactions()
+            peer_nodes = list(self.__peer_nodes)
+        if not is_receiving:
+            # Only broadcasting to peer nodes if on the original node that created the transaction. 
+            # This prevents a chain of infinite requests occuring and only getting back one response
+            if self.broadcaster.binary:
+                payload = encode_transaction(transaction)
+            else:
+                payload = transaction.to_dict()
+            if self.broadcaster.asynchronous:
+                self.broadcaster.post_async(peer_nodes, '/broadcast-transaction', payload)
+            else:
+                # send http requests to all nodes at the same time
+                statuses = self.broadcaster.post(peer_nodes, '/broadcast-transaction', payload)
+                if any(status == 400 or status == 500 for status in statuses.values()):
+                    print('Transaction declined, needs resolving.')
+                    return False
+        return True
 
-        self.__chain.append(block)
-        self.__open_transactions = []
-        self.save_data()
+
+    def add_transactions(self, transactions, is_receiving=False):
+        """Verify many transactions at once and add the valid ones to the open transactions.
+
+        The signatures are checked in bulk, all added transactions are stored with a single write and sent to the
+        peer nodes as a single message.
+
+        Arguments:
+            :transactions: The Transactions which should be added.
+            :is_receiving: Whether the transactions were relayed by a peer node (they are not broadcast again).
+
+        Returns the outcome of every transaction in the same order: 'added', 'known' (already open or repeated in
+        the batch), 'invalid' (wrong signature or negative fee) or 'insufficient_funds'.
+        """
+        results = [None] * len(transactions)
+        seen = set()
+        candidates = []
+        with self.__lock.read():
+            for position, tx in enumerate(transactions):
+                tx_id = tx.id
+                if tx_id in seen or tx in self.__mempool:
+                    results[position] = 'known'
+                else:
+                    seen.add(tx_id)
+                    candidates.append(position)
+        signatures = Verification.verify_signatures([transactions[position] for position in candidates])
+        added = []
+        with self.__lock.write():
+            for position, signature_is_valid in zip(candidates, signatures):
+                tx = transactions[position]
+                if not signature_is_valid or tx.fee < 0:
+                    results[position] = 'invalid'
+                elif tx in self.__mempool:
+                    # Added by another thread while the signatures were checked
+                    results[position] = 'known'
+                # Transactions accepted earlier in the batch already count as pending for their sender
+                elif self.__ledger.get_balance(tx.sender) < tx.cost:
+                    results[position] = 'insufficient_funds'
+                else:
+                    evicted = self.__mempool.add(tx)
+                    self.__ledger.add_pending(tx)
+                    for evicted_tx in evicted:
+                        self.__ledger.remove_pending(evicted_tx)
+                    added.append(tx)
+                    results[position] = 'added'
+            if added:
+                self.save_open_transactions()
+            peer_nodes = list(self.__peer_nodes)
+        if added and not is_receiving:
+            if self.broadcaster.binary:
+                payload = encode_transactions(added)
+            else:
+                payload = {'transactions': [tx.to_dict() for tx in added]}
+            if self.broadcaster.asynchronous:
+                self.broadcaster.post_async(peer_nodes, '/broadcast-transactions', payload)
+            else:
+                statuses = self.broadcaster.post(peer_nodes, '/broadcast-transactions', payload)
+                if any(status == 400 or status == 500 for status in statuses.values()):
+                    print('Transactions declined, needs resolving.')
+        return results
+
+
+    def mine_block(self, progress=None):
+        """Create a new block and add open transactions to it.
+
+        The open transactions are picked by the template (see TemplateBuilder), the ones which do not fit into the
+        block stay open for later blocks. The miner is rewarded with MINING_REWARD plus the fees of the block.
+
+        The search for the proof of work stops as soon as another block is added to the chain (e.g. a block of a
+        peer node), since the proof would no longer fit.
+
+        Arguments:
+            :progress: Called with the number of hashes computed so far while mining (see Miner.proof_of_work).
+                If it returns True, mining is aborted.
+
+        Returns None if no wallet is set up or if mining was aborted or overtaken by another block.
+        """
+        with self.__mining_lock:
+            with self.__lock.read():
+                # The reward goes to the wallet which is set up when mining starts (see set_public_key)
+                public_key = self.public_key
+                if public_key is None:
+                    return None
+                # Fetch the currently last block of the blockchain
+                last_block = self.__chain[-1]
+                # Hash the last block (=> to be able to compare it to the stored hash value)
+                hashed_block = last_block.hash
+                difficulty = self.get_difficulty()
+                index = len(self.__chain)
+                # Copy transaction instead of manipulating the original open transactions
+                # This ensures that if mining should fail, the reward transaction would be prevented from being stored in the open transactions
+                copied_transactions = self.template.select(self.__mempool.get_transactions())
+            def stop_search(hashes):
+                stop = progress(hashes) if progress is not None else False
+                return stop or self.tip.hash != hashed_block
+
+            # Miners should be rewarded, so let's create a reward transaction
+            # reward_transaction = {
+            #     'sender':'MINING',
+            #     'recipient':owner,
+            #     'amount': MINING_REWARD
+            # }
+            
+            fees = sum(tx.fee for tx in copied_transactions)
+            # The block index takes the place of the signature, so rewards of the same amount to the same miner get
+            # a different id in every block (and consecutive blocks a different Merkle root)
+            reward_transaction = Transaction('MINING', public_key, str(index), MINING_REWARD + fees)
+            # The header commits to all transactions (including the reward) through the Merkle root, so the block
+            # is put together before its proof is searched
+            block = Block(index, hashed_block, copied_transactions + [reward_transaction], None, difficulty=difficulty, version=BLOCK_VERSION)
+            # Other threads keep reading and adding transactions while the proof is searched
+            proof = self.miner.search(Verification.block_proof_prefix(block), difficulty, stop_search)
+            if proof is None:
+                return None
+            if not Verification.verify_transactions_batch(copied_transactions):
+                return None
+            block.proof = proof
+
+            with self.__lock.write():
+                if self.__chain[-1].hash != hashed_block:
+                    # A block of a peer node was added in the meantime, so this block no longer fits the chain
+                    return None
+                self.__append_block(block)
+                self.save_blocks()
+                self.save_open_transactions()
+                peer_nodes = list(self.__peer_nodes)
         ## Broadcast 
-        for node in self.__peer_nodes:
-            url = 'http://{}/broadcast-block'.format(node)
-            converted_block = block.__dict__.copy()
-            converted_block['transactions'] = [tx.__dict__ for tx in converted_block['transactions']]
-            try:
-                response = requests.post(url, json={'block': converted_block})
-                if response.status_code == 400 or response.status_code == 500:
-                    print('Block declined, needs resolving.')
-                if response.status_code == 409:
-                    self.resolve_conflicts = True
-            except requests.exceptions.ConnectionError:
-                continue
+        if self.broadcaster.binary:
+            payload = encode_block(block)
+        else:
+            payload = {'block': block.to_dict()}
+        if self.broadcaster.asynchronous:
+            self.broadcaster.post_async(peer_nodes, '/broadcast-block', payload, self.__handle_block_statuses)
+        else:
+            self.__handle_block_statuses(self.broadcaster.post(peer_nodes, '/broadcast-block', payload))
         return block
 
+
+    def __handle_block_statuses(self, statuses):
+        """React to the answers of the peer nodes to a broadcast block."""
+        for status in statuses.values():
+            if status == 400 or status == 500:
+                print('Block declined, needs resolving.')
+            if status == 409:
+                self.resolve_conflicts = True
+
+    def __append_block(self, block):
+        """Append a validated block and update the hash index, balance index and open transactions (write lock held)."""
+        self.__chain.append(block)
+        if self.__hash_index is not None:
+            self.__hash_index[block.hash] = len(self.__chain) - 1
+        self.__ledger.apply_block(block)
+        # Open transactions which are confirmed by the block are looked up by their id
+        for opentx in self.__mempool.remove_confirmed(block.transactions):
+            self.__ledger.remove_pending(opentx)
+
+
     def add_block(self, block):
-        # Validate block, check pow and store
-        # Must convert transactions to a list, because verification expects data in that format. <dictionary to a list of transaction objects>
-        transactions = [Transaction(tx['sender'], tx['recipient'], tx['signature'], tx['amount']) for tx in block['transactions']]
-        proof_is_valid = Verification.valid_proof(transactions[:-1], block['previous_hash'], block['proof'])#Passing in a list of all transactions of block being received when validating pow. 
-        #Avoid last block in chain as it contains the reward transaction and will invalidate it. 
-        # #Usually calculate pow before adding reward transaction (e.g. mine_block). 
-        # using [:-1] avoids using the reward transaction as part of the transactions used to validate the incoming pow which wont work.
-        hashes_match = hash_block(self.chain[-1]) == block['previous_hash'] 
-        if not proof_is_valid or not hashes_match:
+        """Validate a block received from a peer node and append it to the chain.
+
+        Arguments:
+            :block: The block as a Block or as a dictionary (see Block.to_dict).
+
+        Returns False if the block is invalid, malformed or does not fit the end of the chain.
+        """
+        # Must convert the block and its transactions to objects, because verification expects data in that format.
+        try:
+            converted_block = block if isinstance(block, Block) else Block.from_dict(block)
+        except ValueError:
+            return False
+        transactions = converted_block.transactions
+        with self.__lock.read():
+            hashes_match = self.__chain[-1].hash == converted_block.previous_hash
+            index_is_valid = converted_block.index == len(self.__chain)
+            # Block versions never decrease, and blocks of older versions were all mined at the default difficulty
+            version_is_valid = converted_block.version >= self.__chain[-1].version
+            difficulty_is_valid = follows_legacy_rules(self.__chain, converted_block) \
+                or converted_block.difficulty == self.get_difficulty()
+            timestamp_is_valid = valid_timestamp(self.__chain, converted_block)
+        if not hashes_match and self.get_block_height(converted_block.previous_hash) is not None:
+            # The block builds on an older block of the chain, so the peer node is on a fork which has to be resolved
+            self.resolve_conflicts = True
+            return False
+        matches_checkpoint = self.checkpoints.get(converted_block.index, converted_block.hash) == converted_block.hash
+        # Oversized blocks and wrong rewards are declined before the expensive checks
+        size_is_valid = Verification.valid_block_size(converted_block, self.template)
+        reward_is_valid = Verification.valid_reward(converted_block)
+        if not hashes_match or not index_is_valid or not version_is_valid or not difficulty_is_valid or not timestamp_is_valid or not matches_checkpoint \
+                or not size_is_valid or not reward_is_valid:
             return False
-        converted_block = Block(block['index'], block['previous_hash'], transactions, block['proof'], block['timestamp'])
-        self.__chain.append(converted_block)
-        stored_transactions = self.__open_transactions[:]
-        for itx in block['transactions']:
-            for opentx in stored_transactions:
-                # if all fields are equal it is the same transaction
-                if opentx.sender == itx['sender'] and opentx.recipient == itx['recipient'] and opentx.amount == itx['amount'] and opentx.signature == itx['signature']:
-                    try:
-                        self.__open_transactions.remove(opentx)
-                    except ValueError:
-                        print('Item was already removed.')
-        self.save_data()
+        # Version 2 blocks prove their header, which only stands for these transactions if the Merkle root matches.
+        # Version 1 blocks prove their transactions without the reward transaction (it is added after mining).
+        proof_is_valid = Verification.valid_merkle_root(converted_block) and Verification.valid_block_proof(converted_block)
+        if not proof_is_valid:
+            return False
+        try:
+            # A block which can not be encoded could never be stored, so it must not get into the chain either
+            encode_block(converted_block)
+        except (TypeError, ValueError):
+            return False
+        # Signatures are the most expensive check, so they are verified last (except for the reward transaction)
+        if not Verification.verify_transactions_batch(transactions[:-1]):
+            return False
+        with self.__lock.write():
+            if self.__chain[-1].hash != converted_block.previous_hash:
+                # Another block was added while this one was verified
+                return False
+            self.__append_block(converted_block)
+            self.save_blocks()
+            self.save_open_transactions()
         return True
 
 
     def resolve(self):
-        winner_chain = self.chain
-        replace = False ## Control whether current chain is being replaced
-        # Get a snapshot of blockcahin on every peer node to check which peer node has which blockchain & which one is correct.
-        for node in self.__peer_nodes:
-            url = 'http://{}/chain'.format(node)
-            try:
-                response = requests.get(url)
-                node_chain = response.json()
-                node_chain = [Block(block['index'], block['previous_hash'], [Transaction(tx['sender'], tx['recipient'], tx['signature'], tx['amount']) for tx in block['transactions']], block['proof'], block['timestamp']) for block in node_chain]
-                
-                node_chain_length = len(node_chain)
-                local_chain_length = len(winner_chain)
-                if node_chain_length > local_chain_length and Verification.verify_chain(node_chain):
-                    # if chain of peer node is longer and valid, use it as local chain
-                    winner_chain = node_chain
-                    replace = True
-            except requests.exceptions.ConnectionError:
-                continue # avoids break down code for node offline that cant be reached
+        """Replace the local chain with the valid chain of the peer nodes which took the most work to mine.
+
+        The work of a chain is the sum of 2 ** difficulty over its blocks (see chain_work), so a longer chain of cheap
+        blocks does not win against a shorter one which was mined at a higher difficulty.
+
+        All peers are queried and their chains validated at the same time; a peer which does not finish within
+        RESOLVE_TIMEOUT seconds is skipped. Only the head of every peer's chain is requested first. For peers whose
+        head is not part of the local chain the point where both chains diverge is located through block headers, and
+        only the blocks after it are downloaded, compared and verified.
+
+        The outcome per peer is kept in last_resolve_report.
+        """
+        report = {'responded': [], 'timed_out': [], 'unreachable': [], 'invalid': [], 'winner': None}
+        # Fork height, hash of the last shared block, blocks after the fork and additional work of the best chain found
+        winner = None
+        winner_gain = 0
+        peer_nodes = self.get_peer_nodes()
+        if peer_nodes:
+            executor = ThreadPoolExecutor(max_workers=len(peer_nodes))
+            futures = {executor.submit(self.__fetch_node_chain, node): node for node in peer_nodes}
+            done, not_done = wait(futures, timeout=RESOLVE_TIMEOUT)
+            # Threads of peers which did not answer in time are left to finish on their own
+            executor.shutdown(wait=False)
+            for future in not_done:
+                report['timed_out'].append(futures[future])
+            for future in done:
+                node = futures[future]
+                outcome, candidate = future.result()
+                report[outcome].append(node)
+                if candidate is not None and candidate[3] > winner_gain:
+                    winner = candidate
+                    winner_gain = candidate[3]
+                    report['winner'] = node
+        self.last_resolve_report = report
         self.resolve_conflicts = False
-        self.chain = winner_chain
-        if replace:
-            self.__open_transactions = []
-        self.save_data()
-        return replace
+        if winner is None:
+            return False
+        fork_height, fork_hash, node_blocks, _ = winner
+        with self.__lock.write():
+            # The local chain may have changed while the peers were asked
+            if fork_height > len(self.__chain) or self.__chain[fork_height - 1].hash != fork_hash \
+                    or chain_work(node_blocks) <= chain_work(self.__chain[fork_height:]):
+                report['winner'] = None
+                return False
+            self.__replace_blocks(fork_height, node_blocks)
+        return True
+
+
+    def __fetch_node_chain(self, node):
+        """Download and validate the part of a peer node's chain which differs from the local chain.
+
+        Returns the outcome ('responded', 'timed_out', 'unreachable' or 'invalid') and, if the peer has a valid chain
+        which took more work to mine, a tuple of the fork height, the hash of the last shared block, the blocks after
+        the fork and how much more work they took than the local blocks after the fork.
+        """
+        try:
+            head = self.broadcaster.get_json(node, '/chain/head')
+            if self.get_block_height(head['hash']) is not None:
+                # The peer's chain is part of the local chain
+                return 'responded', None
+            fork_height, fork_hash = self.__find_fork_height(node, head['height'])
+            if fork_height == 0:
+                # Not even the genesis block is shared, so the chains can not be compared
+                return 'invalid', None
+            node_blocks = self.__fetch_blocks(node, fork_height, head['height'])
+            with self.__lock.read():
+                if fork_height > len(self.__chain) or self.__chain[fork_height - 1].hash != fork_hash:
+                    # The local chain was replaced in the meantime, so the blocks can not be compared to it
+                    return 'responded', None
+                gain = chain_work(node_blocks) - chain_work(self.__chain[fork_height:])
+                # Only the few shared blocks validation reads are copied: the ones its difficulty and timestamp
+                # checks look back at, and the ones at checkpoint heights
+                heights = set(range(max(0, fork_height - VALIDATION_WINDOW), fork_height))
+                heights.update(height for height in self.checkpoints if height < fork_height)
+                shared_blocks = {height: self.__chain[height] for height in heights}
+            if gain <= 0:
+                return 'responded', None
+            # The chain is verified without the lock, resolve checks again that it still fits before replacing blocks
+            node_chain = ForkView(shared_blocks, fork_height, node_blocks)
+            if Verification.verify_chain(node_chain, self.block_time, start=fork_height, checkpoints=self.checkpoints,
+                                         template=self.template):
+                # if chain of peer node took more work and is valid, it is a candidate for the local chain
+                return 'responded', (fork_height, fork_hash, node_blocks, gain)
+            return 'invalid', None
+        except requests.exceptions.Timeout:
+            return 'timed_out', None
+        except requests.exceptions.RequestException:
+            return 'unreachable', None # avoids break down code for node offline that cant be reached
+        except (ValueError, KeyError, TypeError):
+            return 'invalid', None
+
+
+    def __find_fork_height(self, node, node_height):
+        """Return the number of leading blocks the local chain shares with the chain of a peer node and the hash of
+        the last shared block.
+
+        Headers are requested page by page, walking back from the lower of both tips, until a block is found that
+        is part of the local chain at the same height.
+        """
+        stop = min(self.height, node_height)
+        while stop > 0:
+            start = max(0, stop - SYNC_PAGE_SIZE)
+            headers = self.broadcaster.get_json(node, '/chain/headers', {'from': start, 'to': stop})
+            with self.__lock.read():
+                for header in reversed(headers):
+                    index = header['index']
+                    if 0 <= index < len(self.__chain) and self.__chain[index].hash == header['hash']:
+                        return index + 1, header['hash']
+            stop = start
+        return 0, None
+
+
+    def __fetch_blocks(self, node, start, stop):
+        """Download the blocks start, start + 1, ... stop - 1 of a peer node's chain page by page."""
+        blocks = []
+        accept = BINARY_CONTENT_TYPE if self.broadcaster.binary else None
+        while start + len(blocks) < stop:
+            params = {'from': start + len(blocks), 'limit': min(SYNC_PAGE_SIZE, stop - start - len(blocks))}
+            response = self.broadcaster.get(node, '/blocks', params, accept)
+            # Peers which do not know the binary encoding answer with JSON
+            if response.headers.get('Content-Type', '').startswith(BINARY_CONTENT_TYPE):
+                page = decode_blocks(response.content)
+            else:
+                page = [Block.from_dict(block) for block in response.json()]
+            if not page:
+                break
+            blocks.extend(page)
+        return blocks
+
+
+    def __replace_blocks(self, fork_height, blocks):
+        """Replace all blocks from a height onwards with the blocks of a peer node's chain (write lock held)."""
+        for block in reversed(self.__chain[fork_height:]):
+            self.__ledger.revert_block(block)
+            if self.__hash_index is not None:
+                self.__hash_index.pop(block.hash, None)
+        del self.__chain[fork_height:]
+        # A snapshot taken on the replaced blocks no longer fits the chain
+        self.__snapshot_height = min(self.__snapshot_height, fork_height)
+        self.__mempool.clear()
+        self.__ledger.clear_pending()
+        for block in blocks:
+            self.__append_block(block)
+        # Only the blocks after the point where both chains diverge have to be rewritten in the store
+        self.__storage.truncate(fork_height)
+        self.save_blocks()
+        self.save_open_transactions()
 
     def add_peer_node(self, node):
         """Adds a new node to the peer node set.
         Arguments:
             :node: The node URL which should be added.
         """
-        self.__peer_nodes.add(node)
-        self.save_data()
+        with self.__lock.write():
+            self.__peer_nodes.add(node)
+            self.save_peer_nodes()
     
 
     def remove_peer_node(self, node):
@@ -299,11 +733,13 @@ class Blockchain:
         Arguments:
             :node: The node URL which should be added.
         """
-        self.__peer_nodes.discard(node)
-        self.save_data()
+        with self.__lock.write():
+            self.__peer_nodes.discard(node)
+            self.save_peer_nodes()
     
 
     def get_peer_nodes(self):
         """Return a list of all connected peer nodes"""
-        return list(self.__peer_nodes)
+        with self.__lock.read():
+            return list(self.__peer_nodes)
     
\ No newline at end of file
@@ -0,0 +1,128 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from utility.binary_codec import BINARY_CONTENT_TYPE
+
+
+# Seconds to wait for a peer to accept the connection and to answer
+BROADCAST_TIMEOUT = 5
+# Maximum number of peers contacted at the same time
+BROADCAST_WORKERS = 16
+# Maximum number of broadcasts waiting to be sent in asynchronous mode
+BROADCAST_QUEUE_SIZE = 1000
+
+
+class Broadcaster:
+    """Sends messages to all peer nodes concurrently over pooled keep-alive connections.
+
+    In asynchronous mode broadcasts are put on a bounded queue and sent by a background thread, so the request which
+    triggered the broadcast does not wait for the peers.
+
+    Attributes:
+        :timeout: Seconds to wait for every single peer.
+        :asynchronous: Whether broadcasts are queued instead of being sent right away.
+        :binary: Whether blocks and transactions are sent to and requested from the peers in the binary encoding.
+        :sessions (private): One requests session (connection pool) per peer node.
+        :executor (private): The threads sending to the peers.
+        :queue (private): The broadcasts waiting to be sent in asynchronous mode.
+    """
+    def __init__(self, timeout=BROADCAST_TIMEOUT, max_workers=BROADCAST_WORKERS, asynchronous=False, queue_size=BROADCAST_QUEUE_SIZE, binary=False):
+        self.timeout = timeout
+        self.asynchronous = asynchronous
+        self.binary = binary
+        self.__sessions = {}
+        self.__sessions_lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__queue = None
+        if asynchronous:
+            self.__queue = queue.Queue(maxsize=queue_size)
+            worker = threading.Thread(target=self.__send_queued, daemon=True)
+            worker.start()
+
+    def __session(self, node):
+        """Return the session for a peer node, so connections to it are kept alive and reused."""
+        with self.__sessions_lock:
+            session = self.__sessions.get(node)
+            if session is None:
+                session = requests.Session()
+                self.__sessions[node] = session
+            return session
+
+    def __post_to_node(self, node, path, payload):
+        url = 'http://{}{}'.format(node, path)
+        try:
+            if isinstance(payload, bytes):
+                response = self.__session(node).post(url, data=payload, headers={'Content-Type': BINARY_CONTENT_TYPE}, timeout=self.timeout)
+            else:
+                response = self.__session(node).post(url, json=payload, timeout=self.timeout)
+            return response.status_code
+        except requests.exceptions.RequestException:
+            # in case could not broadcast to node (e.g. no internet or timed out) the other nodes are still informed
+            return None
+
+    def post(self, nodes, path, payload):
+        """Send a message to all nodes at the same time and return their status codes.
+
+        Arguments:
+            :nodes: The peer nodes which should receive the message.
+            :path: The path of the endpoint on the peer nodes (e.g. '/broadcast-block').
+            :payload: The JSON serializable message or a binary encoded block or transaction.
+
+        Returns a dictionary of node to HTTP status code (None if the node could not be reached in time).
+        """
+        futures = {node: self.__executor.submit(self.__post_to_node, node, path, payload) for node in nodes}
+        return {node: future.result() for node, future in futures.items()}
+
+    def get(self, node, path, params=None, accept=None):
+        """Request an endpoint of a peer node and return the response.
+
+        Arguments:
+            :accept: The content type which should be asked for (e.g. BINARY_CONTENT_TYPE), None for the default.
+
+        Raises requests.exceptions.RequestException if the node cannot be reached in time or answers with an error.
+        """
+        url = 'http://{}{}'.format(node, path)
+        headers = {'Accept': accept} if accept else None
+        response = self.__session(node).get(url, params=params, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def get_json(self, node, path, params=None):
+        """Request an endpoint of a peer node and return the decoded JSON response.
+
+        Raises requests.exceptions.RequestException if the node cannot be reached in time or answers with an error
+        and ValueError if the response is not JSON.
+        """
+        return self.get(node, path, params).json()
+
+    def post_async(self, nodes, path, payload, callback=None):
+        """Queue a message for all nodes and return right away.
+
+        Arguments:
+            :callback: Called with the status codes (see post) once the message was sent.
+
+        Returns False if the queue is full and the message was dropped.
+        """
+        try:
+            self.__queue.put_nowait((list(nodes), path, payload, callback))
+            return True
+        except queue.Full:
+            print('WARNING! Broadcast queue is full, message dropped.')
+            return False
+
+    def __send_queued(self):
+        while True:
+            nodes, path, payload, callback = self.__queue.get()
+            statuses = self.post(nodes, path, payload)
+            if callback is not None:
+                callback(statuses)
+            self.__queue.task_done()
+
+    def close(self):
+        """Stop the sending threads and close all connections."""
+        self.__executor.shutdown(wait=False)
+        with self.__sessions_lock:
+            for session in self.__sessions.values():
+                session.close()
+            self.__sessions = {}
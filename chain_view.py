@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from collections.abc import Sequence
+
+
+# Number of blocks at the end of a stored chain which are always kept in memory
+RECENT_BLOCKS = 100
+# Maximum number of older blocks of a stored chain which are kept in memory after they were accessed
+BLOCK_CACHE_SIZE = 1000
+
+
+class ChainView(Sequence):
+    """A read-only view of the blocks of a chain which does not copy the chain.
+
+    Indexing and iterating return the blocks of the chain itself; slicing only copies the sliced part. If the chain
+    is shared between threads, every access holds the read lock of the chain (so a view can be read after the lock
+    was released, e.g. while streaming a response).
+
+    Attributes:
+        :blocks (private): The list of blocks the view reads from.
+        :lock (private): The ReadWriteLock guarding the blocks (or None).
+    """
+    def __init__(self, blocks, lock=None):
+        self.__blocks = blocks
+        self.__lock = lock
+
+    def __reading(self):
+        return self.__lock.read() if self.__lock is not None else nullcontext()
+
+    def __len__(self):
+        with self.__reading():
+            return len(self.__blocks)
+
+    def __getitem__(self, index):
+        with self.__reading():
+            return self.__blocks[index]
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self.__reading():
+                if index >= len(self.__blocks):
+                    return
+                block = self.__blocks[index]
+            yield block
+            index += 1
+
+    def __repr__(self):
+        return 'ChainView(height={})'.format(len(self))
+
+    @property
+    def tip(self):
+        """The last block of the chain."""
+        with self.__reading():
+            return self.__blocks[-1]
+
+
+class ForkView(Sequence):
+    """A read-only view of a chain which shares its first blocks with a local chain and continues with other blocks.
+
+    Used to validate a peer's chain without copying the blocks both chains have in common.
+
+    Attributes:
+        :base (private): The local chain, or a mapping of height to block holding only the shared blocks which are
+            read while validating (e.g. the blocks in front of the fork, see utility.difficulty.VALIDATION_WINDOW).
+        :fork_height (private): The number of leading blocks taken from the local chain.
+        :suffix (private): The blocks following the shared blocks.
+    """
+    def __init__(self, base, fork_height, suffix):
+        self.__base = base
+        self.__fork_height = fork_height
+        self.__suffix = suffix
+
+    def __len__(self):
+        return self.__fork_height + len(self.__suffix)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('chain index out of range')
+        if index < self.__fork_height:
+            return self.__base[index]
+        return self.__suffix[index - self.__fork_height]
+
+
+class StoredChain(Sequence):
+    """A chain whose older blocks stay in the block store and are only decoded when they are accessed.
+
+    The last RECENT_BLOCKS blocks and all blocks which are not stored yet are kept in memory. Older blocks are read
+    from the (memory mapped) store on demand, and the most recently used of them are cached, so the memory used does
+    not grow with the length of the chain and loading it does not read the older blocks at all.
+
+    Attributes:
+        :storage (private): The block store the older blocks are read from.
+        :decode (private): The function which turns a stored record into a Block.
+        :recent_blocks (private): The number of blocks at the end of the chain which are kept in memory.
+        :lazy_height (private): The number of leading blocks which are read from the store on demand.
+        :recent (private): The blocks after the leading ones.
+        :cache (private): Mapping of height to the most recently used older blocks, least recently used first.
+        :cache_size (private): The maximum number of cached older blocks.
+        :cache_lock (private): Guards the cache, which is changed by reading threads as well.
+    """
+    def __init__(self, storage, decode, recent_blocks=RECENT_BLOCKS, cache_size=BLOCK_CACHE_SIZE):
+        self.__storage = storage
+        self.__decode = decode
+        self.__recent_blocks = recent_blocks
+        self.__cache = OrderedDict()
+        self.__cache_size = cache_size
+        self.__cache_lock = threading.Lock()
+        height = len(storage)
+        self.__lazy_height = max(0, height - recent_blocks)
+        self.__recent = [decode(storage.read_block(index)) for index in range(self.__lazy_height, height)]
+
+    def __len__(self):
+        return self.__lazy_height + len(self.__recent)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('chain index out of range')
+        if index >= self.__lazy_height:
+            return self.__recent[index - self.__lazy_height]
+        with self.__cache_lock:
+            block = self.__cache.get(index)
+            if block is not None:
+                self.__cache.move_to_end(index)
+                return block
+        block = self.__decode(self.__storage.read_block(index))
+        with self.__cache_lock:
+            self.__cache[index] = block
+            if len(self.__cache) > self.__cache_size:
+                self.__cache.popitem(last=False)
+        return block
+
+    def __iter__(self):
+        # Walking the whole chain decodes every older block once without evicting the cached ones
+        for index in range(len(self)):
+            if index < self.__lazy_height:
+                block = self.__cache.get(index)
+                yield block if block is not None else self.__decode(self.__storage.read_block(index))
+            else:
+                yield self.__recent[index - self.__lazy_height]
+
+    def __delitem__(self, index):
+        """Remove all blocks from a height onwards (only slices to the end of the chain are supported)."""
+        if not isinstance(index, slice) or index.stop is not None or index.step is not None:
+            raise TypeError('only the end of a chain can be removed')
+        start = index.indices(len(self))[0]
+        if start >= self.__lazy_height:
+            del self.__recent[start - self.__lazy_height:]
+        else:
+            self.__lazy_height = start
+            self.__recent = []
+            with self.__cache_lock:
+                for height in [height for height in self.__cache if height >= start]:
+                    del self.__cache[height]
+
+    def __repr__(self):
+        return 'StoredChain(height={})'.format(len(self))
+
+    def append(self, block):
+        """Append a block (it is kept in memory until it is stored and no longer among the recent blocks)."""
+        self.__recent.append(block)
+
+    def release(self, stored_height):
+        """Drop the in-memory copies of stored blocks which are no longer among the recent blocks.
+
+        Arguments:
+            :stored_height: The number of leading blocks of the chain which are in the block store.
+        """
+        lazy_height = min(stored_height, len(self) - self.__recent_blocks)
+        if lazy_height > self.__lazy_height:
+            del self.__recent[:lazy_height - self.__lazy_height]
+            self.__lazy_height = lazy_height
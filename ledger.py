@@ -0,0 +1,115 @@
+class Ledger:
+    """An index of participant balances, kept up to date as blocks and open transactions come and go.
+
+    Attributes:
+        :confirmed (private): Mapping of participant to the balance confirmed by the blocks of the chain.
+        :pending (private): Mapping of participant to the amount sent in open transactions.
+    """
+    def __init__(self):
+        self.__confirmed = {}
+        self.__pending = {}
+
+    def rebuild(self, chain, open_transactions):
+        """Discard the index and rebuild it from a chain and a list of open transactions.
+
+        Arguments:
+            :chain: The blocks which should be applied.
+            :open_transactions: The open transactions which should be counted as pending.
+        """
+        self.__confirmed = {}
+        self.__pending = {}
+        for block in chain:
+            self.apply_block(block)
+        for tx in open_transactions:
+            self.add_pending(tx)
+
+    def restore(self, balances, blocks, open_transactions):
+        """Discard the index and rebuild it from the confirmed balances of a snapshot.
+
+        Arguments:
+            :balances: The confirmed balances at the height the snapshot was taken (see balances).
+            :blocks: The blocks which were appended after the snapshot was taken.
+            :open_transactions: The open transactions which should be counted as pending.
+        """
+        self.__confirmed = dict(balances)
+        self.__pending = {}
+        for block in blocks:
+            self.apply_block(block)
+        for tx in open_transactions:
+            self.add_pending(tx)
+
+    def balances(self):
+        """Return a copy of all confirmed balances (e.g. to take a snapshot of them)."""
+        return dict(self.__confirmed)
+
+    def apply_block(self, block):
+        """Credit recipients and debit senders (amount plus fee) for all transactions of a block.
+
+        Arguments:
+            :block: The block which was appended to the chain.
+        """
+        for tx in block.transactions:
+            self.__confirmed[tx.sender] = self.__confirmed.get(tx.sender, 0) - tx.cost
+            self.__confirmed[tx.recipient] = self.__confirmed.get(tx.recipient, 0) + tx.amount
+
+    def revert_block(self, block):
+        """Undo apply_block for a block which was removed from the chain (e.g. when switching to a peer's chain)."""
+        for tx in block.transactions:
+            self.__confirmed[tx.sender] = self.__confirmed.get(tx.sender, 0) + tx.cost
+            self.__confirmed[tx.recipient] = self.__confirmed.get(tx.recipient, 0) - tx.amount
+
+    def add_pending(self, transaction):
+        """Reserve the amount and fee of an open transaction on the sender's balance."""
+        self.__pending[transaction.sender] = self.__pending.get(transaction.sender, 0) + transaction.cost
+
+    def remove_pending(self, transaction):
+        """Release the amount of an open transaction which left the open transactions."""
+        remaining = self.__pending.get(transaction.sender, 0) - transaction.cost
+        if remaining:
+            self.__pending[transaction.sender] = remaining
+        else:
+            self.__pending.pop(transaction.sender, None)
+
+    def clear_pending(self):
+        """Release all open transaction amounts (e.g. after the open transactions were mined)."""
+        self.__pending = {}
+
+    def get_balance(self, participant):
+        """Return the confirmed balance of a participant minus the amounts sent in open transactions."""
+        return self.__confirmed.get(participant, 0) - self.__pending.get(participant, 0)
+
+    def participants(self):
+        """Return all participants known to the index."""
+        return set(self.__confirmed) | set(self.__pending)
+
+    def verify(self, chain, open_transactions):
+        """Compare every indexed balance against a full rescan and return True if they all match.
+
+        Arguments:
+            :chain: The blocks the index should reflect.
+            :open_transactions: The open transactions the index should reflect.
+        """
+        participants = self.participants()
+        for block in chain:
+            for tx in block.transactions:
+                participants.update((tx.sender, tx.recipient))
+        for tx in open_transactions:
+            participants.add(tx.sender)
+        return all(abs(self.get_balance(participant) - self.scan_balance(participant, chain, open_transactions)) < 1e-9
+                   for participant in participants)
+
+    @staticmethod
+    def scan_balance(participant, chain, open_transactions):
+        """Calculate the balance of a participant by walking every block and open transaction.
+
+        Arguments:
+            :participant: The participant whose balance should be calculated.
+            :chain: The blocks which should be scanned.
+            :open_transactions: The open transactions which should be scanned.
+        """
+        # Coins sent (including fees) in blocks and in open transactions (to avoid double spending)
+        amount_sent = sum(tx.cost for block in chain for tx in block.transactions if tx.sender == participant)
+        amount_sent += sum(tx.cost for tx in open_transactions if tx.sender == participant)
+        # Open transactions are ignored here because one should not be able to spend coins before the transaction was confirmed + included in a block
+        amount_received = sum(tx.amount for block in chain for tx in block.transactions if tx.recipient == participant)
+        return amount_received - amount_sent
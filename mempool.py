@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+
+# Maximum number of open transactions a node keeps
+MEMPOOL_SIZE = 10000
+
+
+class Mempool:
+    """The open transactions of a node, keyed by transaction id (see Transaction.id) and indexed by sender.
+
+    Transactions are kept in arrival order. Once the pool is full, adding a transaction evicts the oldest one.
+
+    Attributes:
+        :max_size: The maximum number of open transactions.
+        :transactions (private): Mapping of transaction id to transaction, in arrival order.
+        :by_sender (private): Mapping of sender to the ids of their open transactions.
+        :version: Counts the changes of the pool, so miners can tell whether their block template is outdated.
+    """
+    def __init__(self, transactions=None, max_size=MEMPOOL_SIZE):
+        self.max_size = max_size
+        self.__transactions = OrderedDict()
+        self.__by_sender = {}
+        self.version = 0
+        for tx in transactions or []:
+            self.add(tx)
+
+    def __len__(self):
+        return len(self.__transactions)
+
+    def __iter__(self):
+        return iter(list(self.__transactions.values()))
+
+    def __contains__(self, transaction):
+        return transaction.id in self.__transactions
+
+    def get(self, tx_id):
+        """Return the open transaction with an id (or None)."""
+        return self.__transactions.get(tx_id)
+
+    def get_transactions(self):
+        """Return a list of all open transactions in arrival order."""
+        return list(self.__transactions.values())
+
+    def get_sender_transactions(self, sender):
+        """Return the open transactions of a sender."""
+        return [self.__transactions[tx_id] for tx_id in self.__by_sender.get(sender, ())]
+
+    def add(self, transaction):
+        """Add a transaction and return the list of transactions evicted to make room for it.
+
+        Returns None (and adds nothing) if the transaction is already open.
+        """
+        tx_id = transaction.id
+        if tx_id in self.__transactions:
+            return None
+        self.__transactions[tx_id] = transaction
+        self.version += 1
+        self.__by_sender.setdefault(transaction.sender, OrderedDict())[tx_id] = None
+        evicted = []
+        while len(self.__transactions) > self.max_size:
+            oldest_id = next(iter(self.__transactions))
+            evicted.append(self.remove(oldest_id))
+        return evicted
+
+    def remove(self, tx_id):
+        """Remove the open transaction with an id and return it (or None if it is not open)."""
+        transaction = self.__transactions.pop(tx_id, None)
+        if transaction is not None:
+            self.version += 1
+            sender_ids = self.__by_sender[transaction.sender]
+            del sender_ids[tx_id]
+            if not sender_ids:
+                del self.__by_sender[transaction.sender]
+        return transaction
+
+    def remove_confirmed(self, transactions):
+        """Remove all open transactions which are contained in a list (e.g. of a new block) and return them."""
+        removed = []
+        for tx in transactions:
+            open_tx = self.remove(tx.id)
+            if open_tx is not None:
+                removed.append(open_tx)
+        return removed
+
+    def clear(self):
+        """Remove all open transactions."""
+        self.__transactions.clear()
+        self.__by_sender.clear()
+        self.version += 1
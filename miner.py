@@ -0,0 +1,154 @@
+import multiprocessing
+import time
+from utility.hash_util import ProofHasher
+from utility.difficulty import DEFAULT_DIFFICULTY
+from utility.verification import Verification
+
+
+# Supported mining modes: search on the current process or spread the search over a process pool
+MINING_MODES = ('single', 'pool')
+# Number of proof numbers a pool worker tries before checking whether another worker already succeeded
+CHUNK_SIZE = 5000
+# Seconds between two progress reports while the pool is searching
+POLL_INTERVAL = 0.1
+
+# Set by any pool worker which found a valid proof (or by the miner to abort) so all other workers stop searching
+_found_event = None
+# Number of proof numbers tried by all pool workers in the current search
+_hash_counter = None
+
+
+def _init_worker(found_event, hash_counter):
+    global _found_event, _hash_counter
+    _found_event = found_event
+    _hash_counter = hash_counter
+
+
+def _search_worker(args):
+    """Search the proof numbers of one worker until a valid proof was found by any worker.
+
+    The nonce space is split into chunks which are handed out round robin, so worker k tries the chunks
+    k, k + workers, k + 2 * workers, ...
+
+    Arguments:
+        :args: The serialized proof prefix, the difficulty, the worker number, the number of workers and the chunk size.
+    """
+    prefix, difficulty, worker, workers, chunk_size = args
+    hasher = ProofHasher(prefix, difficulty)
+    hashes = 0
+    chunk = worker
+    while not _found_event.is_set():
+        start = chunk * chunk_size
+        proof = hasher.search(start, chunk_size)
+        if proof is not None:
+            _found_event.set()
+            return proof, hashes + proof - start + 1
+        hashes += chunk_size
+        with _hash_counter.get_lock():
+            _hash_counter.value += chunk_size
+        chunk += workers
+    return None, hashes
+
+
+class Miner:
+    """Searches a proof of work number for a block, either on the current process or on a pool of processes.
+
+    Attributes:
+        :mode: The mining mode ('single' or 'pool').
+        :processes: The number of pool workers (defaults to the number of cores).
+        :chunk_size: The number of proof numbers a worker tries between cancellation checks.
+        :hashes: The number of hashes computed for the last proof.
+        :duration: The time in seconds it took to find the last proof.
+    """
+    def __init__(self, mode='single', processes=None, chunk_size=CHUNK_SIZE):
+        if mode not in MINING_MODES:
+            raise ValueError('Unknown mining mode: {}'.format(mode))
+        self.mode = mode
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.hashes = 0
+        self.duration = 0.0
+        self.__pool = None
+        self.__found_event = None
+        self.__hash_counter = None
+
+    @property
+    def hash_rate(self):
+        """The hashes per second achieved while searching the last proof."""
+        if self.duration <= 0:
+            return float(self.hashes)
+        return self.hashes / self.duration
+
+    def proof_of_work(self, transactions, last_hash, difficulty=DEFAULT_DIFFICULTY, progress=None):
+        """Return the first valid proof number found for the transactions and the hash of the previous block.
+
+        Arguments:
+            :transactions: The transactions of the block for which the proof is created.
+            :last_hash: The hash of the previous block.
+            :difficulty: The number of leading zero bits the proof of work hash needs.
+            :progress: Called with the number of hashes computed so far while searching and once more at the end.
+                If it returns True while searching, the search is aborted and None is returned.
+        """
+        # The transactions and the previous hash are only serialized once per block
+        return self.search(Verification.proof_prefix(transactions, last_hash), difficulty, progress)
+
+    def search(self, prefix, difficulty=DEFAULT_DIFFICULTY, progress=None):
+        """Return the first valid proof number found for an already serialized proof of work prefix.
+
+        Arguments:
+            :prefix: The part of the proof of work input in front of the proof number (see Verification.block_proof_prefix).
+            :difficulty: The number of leading zero bits the proof of work hash needs.
+            :progress: See proof_of_work.
+        """
+        start = time.time()
+        if self.mode == 'pool':
+            proof, hashes = self.__search_pool(prefix, difficulty, progress)
+        else:
+            hasher = ProofHasher(prefix, difficulty)
+            start_proof = 0
+            proof = hasher.search(start_proof, self.chunk_size)
+            while proof is None:
+                start_proof += self.chunk_size
+                if progress is not None and progress(start_proof):
+                    break
+                proof = hasher.search(start_proof, self.chunk_size)
+            hashes = proof + 1 if proof is not None else start_proof
+        self.duration = time.time() - start
+        self.hashes = hashes
+        if progress is not None:
+            progress(hashes)
+        return proof
+
+    def __search_pool(self, prefix, difficulty, progress=None):
+        if self.__pool is None:
+            self.__found_event = multiprocessing.Event()
+            self.__hash_counter = multiprocessing.Value('Q', 0)
+            self.__pool = multiprocessing.Pool(self.processes, _init_worker, (self.__found_event, self.__hash_counter))
+        self.__found_event.clear()
+        self.__hash_counter.value = 0
+        jobs = [(prefix, difficulty, worker, self.processes, self.chunk_size) for worker in range(self.processes)]
+        proofs = []
+        hashes = 0
+        results = self.__pool.imap_unordered(_search_worker, jobs)
+        # Every worker returns once any of them found a proof (or the search was aborted), so this waits for all workers to stop
+        finished = 0
+        while finished < len(jobs):
+            try:
+                proof, worker_hashes = results.next(timeout=POLL_INTERVAL)
+            except multiprocessing.TimeoutError:
+                if progress is not None and progress(self.__hash_counter.value):
+                    self.__found_event.set()
+                continue
+            finished += 1
+            hashes += worker_hashes
+            if proof is not None:
+                proofs.append(proof)
+        self.__found_event.clear()
+        return (min(proofs) if proofs else None), hashes
+
+    def close(self):
+        """Shut down the process pool (if one was started)."""
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool.join()
+            self.__pool = None
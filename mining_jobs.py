@@ -0,0 +1,249 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+# Number of finished mining jobs which are remembered, so their outcome can still be requested
+MAX_FINISHED_JOBS = 100
+# Outcomes of a mining job
+JOB_STATUSES = ('running', 'done', 'failed', 'cancelled')
+# Seconds a block template is mined on at least before new open transactions make the continuous miner start over
+MIN_TEMPLATE_AGE = 1.0
+# Seconds the continuous miner waits before trying again while it can not mine (no wallet or unresolved conflicts)
+IDLE_INTERVAL = 1.0
+
+
+class MiningJob:
+    """A block which is mined on a background thread.
+
+    If another block is added to the chain while mining (e.g. a block of a peer node), the job starts over on the
+    new tip with the open transactions at that time.
+
+    Attributes:
+        :id: The id the job is requested by.
+        :status: One of JOB_STATUSES.
+        :block: The mined block once the job is done.
+        :restarts: How often mining started over because another block was added to the chain.
+        :started: The time the job was started at.
+        :finished: The time the job finished at (or None).
+        :blockchain (private): The blockchain the block is mined for.
+        :hashes (private): The number of hashes computed by the finished attempts.
+        :attempt_hashes (private): The number of hashes computed by the current attempt.
+        :cancelled (private): Set to abort the job.
+        :done (private): Set once the job finished.
+    """
+    def __init__(self, job_id, blockchain):
+        self.id = job_id
+        self.status = 'running'
+        self.block = None
+        self.restarts = 0
+        self.started = time.time()
+        self.finished = None
+        self.__blockchain = blockchain
+        self.__hashes = 0
+        self.__attempt_hashes = 0
+        self.__cancelled = threading.Event()
+        self.__done = threading.Event()
+
+    @property
+    def hashes(self):
+        """The number of proof numbers tried so far."""
+        return self.__hashes + self.__attempt_hashes
+
+    @property
+    def elapsed(self):
+        """The seconds the job has been running for (or ran for, once it finished)."""
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def hash_rate(self):
+        """The hashes per second achieved by the job."""
+        if self.elapsed <= 0:
+            return float(self.hashes)
+        return self.hashes / self.elapsed
+
+    def start(self):
+        """Start mining on a background thread."""
+        threading.Thread(target=self.__run, daemon=True).start()
+
+    def cancel(self):
+        """Abort the job (a block which was already found is still added)."""
+        self.__cancelled.set()
+
+    def wait(self, timeout=None):
+        """Wait until the job finished and return True if it did within the timeout."""
+        return self.__done.wait(timeout)
+
+    def to_dict(self):
+        """Converts this job into a dictionary (used for status responses)."""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'hashes': self.hashes,
+            'hash_rate': self.hash_rate,
+            'elapsed': self.elapsed,
+            'restarts': self.restarts,
+            'block': self.block.to_dict() if self.block is not None else None
+        }
+
+    def __progress(self, hashes):
+        self.__attempt_hashes = hashes
+        return self.__cancelled.is_set()
+
+    def __run(self):
+        try:
+            while True:
+                tip_hash = self.__blockchain.tip.hash
+                self.__attempt_hashes = 0
+                block = self.__blockchain.mine_block(self.__progress)
+                self.__hashes += self.__attempt_hashes
+                self.__attempt_hashes = 0
+                if block is not None:
+                    self.block = block
+                    self.status = 'done'
+                elif self.__cancelled.is_set():
+                    self.status = 'cancelled'
+                elif self.__blockchain.tip.hash != tip_hash:
+                    # Overtaken by another block, so mining starts over on top of it
+                    self.restarts += 1
+                    continue
+                break
+        finally:
+            if self.status == 'running':
+                self.status = 'failed'
+            self.finished = time.time()
+            self.__done.set()
+
+
+class MiningJobs:
+    """Starts mining jobs and keeps track of them by id.
+
+    Attributes:
+        :max_finished: The number of finished jobs which are remembered.
+        :jobs (private): Mapping of job id to job, oldest first.
+        :lock (private): Guards the jobs, which are started and requested from several threads.
+    """
+    def __init__(self, max_finished=MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self.__jobs = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def start(self, blockchain):
+        """Start a job which mines a block for a blockchain and return it."""
+        job = MiningJob(uuid.uuid4().hex, blockchain)
+        with self.__lock:
+            self.__jobs[job.id] = job
+            finished = [job_id for job_id, other in self.__jobs.items() if other.status != 'running']
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self.__jobs[job_id]
+        job.start()
+        return job
+
+    def get(self, job_id):
+        """Return the job with an id (or None)."""
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+
+class ContinuousMiner:
+    """Mines one block after another on a background thread for as long as it runs.
+
+    Every attempt mines a template of the current tip and open transactions. An attempt is abandoned as soon as
+    another block is added to the chain, or once open transactions were added or removed and the template is at least
+    MIN_TEMPLATE_AGE seconds old, and mining starts over on the new template right away.
+
+    Attributes:
+        :blockchain: The blockchain blocks are mined for.
+        :min_template_age: The seconds a template is mined on at least before new open transactions replace it.
+        :blocks: The number of blocks mined.
+        :restarts: How often an attempt was abandoned for a new template.
+        :started: The time the miner was started at (or None).
+        :hashes (private): The number of hashes computed by the finished attempts.
+        :attempt_hashes (private): The number of hashes computed by the current attempt.
+        :stopped (private): Set to stop the miner.
+    """
+    def __init__(self, blockchain, min_template_age=MIN_TEMPLATE_AGE):
+        self.blockchain = blockchain
+        self.min_template_age = min_template_age
+        self.blocks = 0
+        self.restarts = 0
+        self.started = None
+        self.__hashes = 0
+        self.__attempt_hashes = 0
+        self.__stopped = threading.Event()
+
+    @property
+    def running(self):
+        """Whether the miner was started and not stopped yet."""
+        return self.started is not None and not self.__stopped.is_set()
+
+    @property
+    def hashes(self):
+        """The number of proof numbers tried so far."""
+        return self.__hashes + self.__attempt_hashes
+
+    @property
+    def hash_rate(self):
+        """The hashes per second achieved since the miner was started."""
+        if self.started is None:
+            return 0.0
+        elapsed = time.time() - self.started
+        if elapsed <= 0:
+            return float(self.hashes)
+        return self.hashes / elapsed
+
+    def start(self):
+        """Start mining on a background thread."""
+        self.started = time.time()
+        threading.Thread(target=self.__run, daemon=True).start()
+
+    def stop(self):
+        """Stop mining (the current attempt is abandoned)."""
+        self.__stopped.set()
+
+    def to_dict(self):
+        """Converts the state of this miner into a dictionary (used for status responses)."""
+        return {
+            'running': self.running,
+            'blocks': self.blocks,
+            'restarts': self.restarts,
+            'hashes': self.hashes,
+            'hash_rate': self.hash_rate
+        }
+
+    def __mine_template(self, blockchain):
+        """Mine a block on the current template and return it (or None if the attempt was abandoned)."""
+        # Read before the template is built, so a change in between makes the attempt start over rather than go unnoticed
+        mempool_version = blockchain.mempool_version
+        template_time = time.time()
+
+        def progress(hashes):
+            self.__attempt_hashes = hashes
+            if self.__stopped.is_set():
+                return True
+            outdated = blockchain.mempool_version != mempool_version
+            return outdated and time.time() - template_time >= self.min_template_age
+
+        self.__attempt_hashes = 0
+        block = blockchain.mine_block(progress)
+        self.__hashes += self.__attempt_hashes
+        self.__attempt_hashes = 0
+        return block
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            blockchain = self.blockchain
+            if blockchain.public_key is None or blockchain.resolve_conflicts:
+                self.__stopped.wait(IDLE_INTERVAL)
+                continue
+            try:
+                block = self.__mine_template(blockchain)
+            except Exception as error:
+                print('Mining failed: {}'.format(error))
+                self.__stopped.wait(IDLE_INTERVAL)
+                continue
+            if block is not None:
+                self.blocks += 1
+            elif not self.__stopped.is_set():
+                self.restarts += 1
@@ -1,10 +1,37 @@
-from flask import Flask, jsonify, request, send_from_directory
+import json
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 from wallet import Wallet
 from blockchain import Blockchain
+from miner import Miner, MINING_MODES
+from mining_jobs import MiningJobs, ContinuousMiner
+from block_template import TemplateBuilder, TEMPLATE_POLICIES, MAX_BLOCK_TRANSACTIONS, MAX_BLOCK_SIZE
+from broadcast import Broadcaster, BROADCAST_TIMEOUT
+from utility.difficulty import TARGET_BLOCK_TIME
+from utility.binary_codec import BINARY_CONTENT_TYPE, decode_block, decode_transaction, decode_transactions, encode_blocks
+from block import Block
+from transaction import Transaction
+
+# Maximum number of headers or blocks returned by one request
+MAX_PAGE_SIZE = 1000
+# Maximum number of transactions submitted in one batch
+MAX_BATCH_SIZE = 1000
 
 app = Flask(__name__)
 CORS(app) # ensure clients on the same server can access this server
+mining_jobs = MiningJobs()
+# Mines blocks all the time if the node is started with --continuous-mining
+continuous_miner = None
+
+
+def is_binary_request():
+    """Return True if the body of the request is binary encoded (see utility.binary_codec)."""
+    return request.mimetype == BINARY_CONTENT_TYPE
+
+
+def wants_binary_response():
+    """Return True if the client prefers binary encoded blocks over JSON (JSON stays the default, e.g. for the UI)."""
+    return request.accept_mimetypes.best_match(['application/json', BINARY_CONTENT_TYPE]) == BINARY_CONTENT_TYPE
 
 
 @app.route('/', methods=['GET'])
@@ -19,8 +46,8 @@ def get_network_ui():
 def create_keys():
     wallet.create_keys()
     if wallet.save_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
+        # The running blockchain is kept, a second one would open the same block store
+        blockchain.set_public_key(wallet.public_key)
         response = {
             'public_key': wallet.public_key,
             'private_key': wallet.private_key,
@@ -37,8 +64,8 @@ def create_keys():
 def load_keys():
     wallet.load_keys()
     if wallet.load_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
+        # The running blockchain is kept, a second one would open the same block store
+        blockchain.set_public_key(wallet.public_key)
         response = {
             'public_key': wallet.public_key,
             'private_key': wallet.private_key,
@@ -69,7 +96,14 @@ def get_balance():
 
 @app.route('/broadcast-transaction', methods=['POST'])
 def broadcast_transaction():
-    values = request.get_json()
+    if is_binary_request():
+        try:
+            values = decode_transaction(request.get_data()).to_dict()
+        except ValueError:
+            response = {'message': 'Transaction could not be decoded.'}
+            return jsonify(response), 400
+    else:
+        values = request.get_json()
     if not values:
         response = {'message':'No data found.'}
         return jsonify(response), 400
@@ -79,17 +113,20 @@ def broadcast_transaction():
         response = {'message':'Some data is missing.'}
         return jsonify(response), 400  
 
-    success = blockchain.add_transaction(values['recipient'], values['sender'], values['signature'],values['amount'], is_receiving=True)
+    fee = values.get('fee', 0)
+    if not isinstance(fee, (int, float)):
+        response = {'message': 'Fee must be a number.'}
+        return jsonify(response), 400
+    if blockchain.has_open_transaction(values['sender'], values['recipient'], values['signature'], values['amount'], fee):
+        response = {'message': 'Transaction already known.'}
+        return jsonify(response), 409
+
+    success = blockchain.add_transaction(values['recipient'], values['sender'], values['signature'],values['amount'], is_receiving=True, fee=fee)
     
     if success:
         response = {
             'message': 'Successfully added transaction.',
-            'transaction': {
-                'sender': values['sender'],
-                'recipient': values['recipient'],
-                'amount': values['amount'],
-                'signature': values['signature']
-            }
+            'transaction': Transaction.from_dict(values).to_dict()
         }
         return jsonify(response), 201
     else:
@@ -101,16 +138,29 @@ def broadcast_transaction():
 
 @app.route('/broadcast-block', methods=['POST'])
 def broadcast_block():
-    values = request.get_json()
-    if not values:
-        response = {'message':'No data found.'}
-        return jsonify(response), 400
-    if 'block' not in values:
-        response = {'message': 'Some data is missing.'}
-        return jsonify(response), 400
-    block = values['block']
+    if is_binary_request():
+        try:
+            block = decode_block(request.get_data())
+        except ValueError:
+            response = {'message': 'Block could not be decoded.'}
+            return jsonify(response), 400
+        index = block.index
+    else:
+        values = request.get_json()
+        if not values:
+            response = {'message':'No data found.'}
+            return jsonify(response), 400
+        if 'block' not in values:
+            response = {'message': 'Some data is missing.'}
+            return jsonify(response), 400
+        try:
+            block = Block.from_dict(values['block'])
+        except ValueError:
+            response = {'message': 'Block could not be decoded.'}
+            return jsonify(response), 400
+        index = block.index
     # Check if on peer node the index of the incoming block is higher than the index of the last block on that peer
-    if block['index'] == blockchain.chain[-1].index + 1:
+    if index == blockchain.tip.index + 1:
         if blockchain.add_block(block):
             response = {'message':'Block added.'}
             return jsonify(response), 201
@@ -120,7 +170,7 @@ def broadcast_block():
             return jsonify(response),409
 
     # Else if the incoming block index is greater than our last block index
-    elif block['index'] > blockchain.chain[-1].index:
+    elif index > blockchain.tip.index:
         # If inbound blockchain larger than local (e.g. error on peer node)
         response = {'message':'Blockchain appears to differ from local blockchain.'}
         blockchain.resolve_conflicts = True
@@ -133,6 +183,51 @@ def broadcast_block():
         return jsonify(response), 409
 
 
+@app.route('/transactions/batch', methods=['POST'])
+def add_transaction_batch():
+    return submit_transactions(is_receiving=False)
+
+
+@app.route('/broadcast-transactions', methods=['POST'])
+def broadcast_transactions():
+    return submit_transactions(is_receiving=True)
+
+
+def submit_transactions(is_receiving):
+    """Add a batch of signed transactions and answer with the outcome of every single one."""
+    if is_binary_request():
+        try:
+            transactions = [tx.to_dict() for tx in decode_transactions(request.get_data())]
+        except ValueError:
+            response = {'message': 'Transactions could not be decoded.'}
+            return jsonify(response), 400
+    else:
+        values = request.get_json()
+        if not values or not isinstance(values.get('transactions'), list):
+            response = {'message': 'No transactions found.'}
+            return jsonify(response), 400
+        transactions = values['transactions']
+    if len(transactions) > MAX_BATCH_SIZE:
+        response = {'message': 'Too many transactions, at most {} are accepted at once.'.format(MAX_BATCH_SIZE)}
+        return jsonify(response), 413
+
+    required = ['sender', 'recipient', 'amount', 'signature']
+    results = ['malformed'] * len(transactions)
+    positions = []
+    for position, values in enumerate(transactions):
+        if isinstance(values, dict) and all(key in values for key in required) and isinstance(values['amount'], (int, float)) \
+                and isinstance(values.get('fee', 0), (int, float)):
+            positions.append(position)
+    outcomes = blockchain.add_transactions([Transaction.from_dict(transactions[position]) for position in positions], is_receiving)
+    for position, outcome in zip(positions, outcomes):
+        results[position] = outcome
+    response = {
+        'message': 'Processed {} transactions.'.format(len(transactions)),
+        'results': results
+    }
+    return jsonify(response), 201 if 'added' in results else 200
+
+
 @app.route('/transaction', methods=['POST'])
 def add_transaction():
     if wallet.public_key is None:
@@ -155,17 +250,21 @@ def add_transaction():
 
     recipient = values['recipient']
     amount = values['amount']
-    signature = wallet.sign_transaction(wallet.public_key, recipient, amount)
-    success = blockchain.add_transaction(recipient, wallet.public_key, signature, amount)
+    # An optional fee makes the transaction more attractive to miners using the fee policy
+    fee = values.get('fee', 0)
+    if not isinstance(fee, (int, float)):
+        response = {
+            'message': 'Fee must be a number.'
+        }
+        return jsonify(response), 400
+    signature = wallet.sign_transaction(wallet.public_key, recipient, amount, fee)
+    success = blockchain.add_transaction(recipient, wallet.public_key, signature, amount, fee=fee)
     if success:
+        transaction = Transaction(wallet.public_key, recipient, signature, amount, fee)
         response = {
             'message': 'Successfully added transaction.',
-            'transaction': {
-                'sender': wallet.public_key,
-                'recipient': recipient,
-                'amount': amount,
-                'signature': signature
-            },
+            'transaction': transaction.to_dict(),
+            'tx_id': transaction.id,
             'funds': blockchain.get_balance()
         }
         return jsonify(response), 201
@@ -181,14 +280,35 @@ def mine():
     if blockchain.resolve_conflicts:
         response = {'message': 'Resolve conflicts first, block not added!'}
         return jsonify(response), 409
-    block = blockchain.mine_block()
+    if wallet.public_key is None:
+        response = {
+            'message': 'Adding a block failed.',
+            'wallet_set_up': False
+        }
+        return jsonify(response), 500
+    if continuous_miner is not None and continuous_miner.running:
+        response = {
+            'message': 'Continuous mining is running.',
+            'miner': continuous_miner.to_dict()
+        }
+        return jsonify(response), 409
+    # Mining runs in the background, the job can be followed through /mine/<job_id>
+    job = mining_jobs.start(blockchain)
+    if request.args.get('wait', '').lower() not in ('1', 'true', 'yes'):
+        response = {
+            'message': 'Mining started.',
+            'job': job.to_dict()
+        }
+        return jsonify(response), 202
+    job.wait()
+    block = job.block
     if block is not None:
-        dict_block = block.__dict__.copy()
-        dict_block['transactions'] = [tx.__dict__ for tx in dict_block['transactions']]
+        dict_block = block.to_dict()
         response = {
             'message': 'Block added successfully.',
             'block': dict_block,
-            'funds': blockchain.get_balance()
+            'funds': blockchain.get_balance(),
+            'hash_rate': job.hash_rate
         }
         return jsonify(response), 201
 
@@ -199,6 +319,42 @@ def mine():
         }
         return jsonify(response), 500
 
+@app.route('/mine/<job_id>', methods=['GET'])
+def get_mining_job(job_id):
+    job = mining_jobs.get(job_id)
+    if job is None:
+        response = {'message': 'Mining job not found.'}
+        return jsonify(response), 404
+    response = {
+        'job': job.to_dict(),
+        'funds': blockchain.get_balance()
+    }
+    return jsonify(response), 200
+
+
+@app.route('/mine/<job_id>', methods=['DELETE'])
+def cancel_mining_job(job_id):
+    job = mining_jobs.get(job_id)
+    if job is None:
+        response = {'message': 'Mining job not found.'}
+        return jsonify(response), 404
+    job.cancel()
+    response = {
+        'message': 'Mining job cancelled.',
+        'job': job.to_dict()
+    }
+    return jsonify(response), 200
+
+
+@app.route('/miner', methods=['GET'])
+def get_miner():
+    response = {
+        'miner': continuous_miner.to_dict() if continuous_miner is not None else {'running': False},
+        'funds': blockchain.get_balance()
+    }
+    return jsonify(response), 200
+
+
 @app.route('/resolve-conflicts', methods=['POST'])
 def resolve_conflicts():
     replaced = blockchain.resolve()
@@ -206,6 +362,7 @@ def resolve_conflicts():
         response = {'message': 'Chain was replaced!'}
     else:
         response = {'message': 'Local chain kept.'}
+    response['peers'] = blockchain.last_resolve_report
     return jsonify(response), 200
 
 
@@ -213,17 +370,96 @@ def resolve_conflicts():
 def get_open_transactions():
     transactions = blockchain.get_open_transactions()
     # need to convert transaction objects
-    dict_transactions = [tx.__dict__ for tx in transactions]
+    dict_transactions = [tx.to_dict() for tx in transactions]
     return jsonify(dict_transactions), 200
 
 
+@app.route('/transactions/<tx_id>/proof', methods=['GET'])
+def get_inclusion_proof(tx_id):
+    # The height of the block is optional, without it the chain is searched
+    found = blockchain.get_inclusion_proof(tx_id, request.args.get('block', type=int))
+    if found is None:
+        response = {'message': 'Transaction not found.'}
+        return jsonify(response), 404
+    block, position, proof = found
+    if proof is None:
+        response = {'message': 'Block has no Merkle root.', 'block': block.to_header()}
+        return jsonify(response), 409
+    # A light client checks the proof against the Merkle root of the header (see utility.merkle.verify_merkle_proof)
+    response = {
+        'tx_id': tx_id,
+        'block': block.to_header(),
+        'position': position,
+        'proof': proof
+    }
+    return jsonify(response), 200
+
+
 @app.route('/chain', methods=['GET'])
 def get_chain():
-    chain_snapshot = blockchain.chain
-    dict_chain = [block.__dict__.copy() for block in chain_snapshot]
-    for dict_block in dict_chain:
-        dict_block['transactions'] = [tx.__dict__ for tx in dict_block['transactions']]
-    return jsonify(dict_chain), 200
+    # Optional paging: blocks after since_index, skipping offset blocks, at most limit blocks
+    chain_snapshot = blockchain.chain_view
+    height = len(chain_snapshot)
+    start = request.args.get('since_index', -1, type=int) + 1
+    start = max(0, start + request.args.get('offset', 0, type=int))
+    limit = request.args.get('limit', type=int)
+    stop = height if limit is None else min(height, start + max(0, limit))
+    headers = {'X-Chain-Height': str(height)}
+    if wants_binary_response():
+        # Binary records are length prefixed, so they are always streamed
+        return Response(encode_blocks(snapshot_blocks(chain_snapshot, start, stop)), mimetype=BINARY_CONTENT_TYPE, headers=headers)
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return Response(stream_blocks(chain_snapshot, start, stop), mimetype='application/json', headers=headers)
+    dict_chain = [block.to_dict() for block in chain_snapshot[start:stop]]
+    return jsonify(dict_chain), 200, headers
+
+
+def snapshot_blocks(chain_snapshot, start, stop):
+    """Yield the blocks start, start + 1, ... stop - 1 of a chain view one at a time."""
+    for index in range(start, stop):
+        try:
+            yield chain_snapshot[index]
+        except IndexError:
+            # The chain was replaced by a shorter one while streaming
+            return
+
+
+def stream_blocks(chain_snapshot, start, stop):
+    """Generate a JSON array of blocks piece by piece, so only one block is converted at a time."""
+    yield '['
+    for position, block in enumerate(snapshot_blocks(chain_snapshot, start, stop)):
+        yield (',' if position else '') + json.dumps(block.to_dict())
+    yield ']'
+
+
+@app.route('/chain/head', methods=['GET'])
+def get_chain_head():
+    tip = blockchain.tip
+    response = {
+        'height': blockchain.height,
+        'index': tip.index,
+        'hash': tip.hash
+    }
+    return jsonify(response), 200
+
+
+@app.route('/chain/headers', methods=['GET'])
+def get_chain_headers():
+    # Headers of the blocks from (inclusive) to (exclusive), at most MAX_PAGE_SIZE at once
+    start = max(0, request.args.get('from', 0, type=int))
+    stop = min(request.args.get('to', blockchain.height, type=int), start + MAX_PAGE_SIZE)
+    headers = [block.to_header() for block in blockchain.chain_view[start:stop]]
+    return jsonify(headers), 200
+
+
+@app.route('/blocks', methods=['GET'])
+def get_blocks():
+    start = max(0, request.args.get('from', 0, type=int))
+    limit = min(max(0, request.args.get('limit', MAX_PAGE_SIZE, type=int)), MAX_PAGE_SIZE)
+    if wants_binary_response():
+        return Response(b''.join(encode_blocks(blockchain.chain_view[start:start + limit])), mimetype=BINARY_CONTENT_TYPE)
+    dict_blocks = [block.to_dict() for block in blockchain.chain_view[start:start + limit]]
+    return jsonify(dict_blocks), 200
 
 
 @app.route('/node', methods=['POST'])
@@ -275,9 +511,32 @@ if __name__ =='__main__':
     from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument('-p','--port',type=int, default=5000)
+    parser.add_argument('-m','--mining-mode', choices=MINING_MODES, default='single')
+    parser.add_argument('-t','--block-time', type=float, default=TARGET_BLOCK_TIME)
+    parser.add_argument('--broadcast-timeout', type=float, default=BROADCAST_TIMEOUT)
+    parser.add_argument('--async-broadcast', action='store_true')
+    parser.add_argument('--binary', action='store_true')
+    parser.add_argument('--lazy-chain', action='store_true')
+    parser.add_argument('--checkpoint', action='append', default=[], metavar='HEIGHT:HASH')
+    parser.add_argument('--continuous-mining', action='store_true')
+    parser.add_argument('--block-policy', choices=TEMPLATE_POLICIES, default='arrival')
+    parser.add_argument('--max-block-transactions', type=int, default=MAX_BLOCK_TRANSACTIONS)
+    parser.add_argument('--max-block-size', type=int, default=MAX_BLOCK_SIZE)
     args = parser.parse_args()
     port = args.port
+    miner = Miner(args.mining_mode)
+    block_time = args.block_time
+    lazy_chain = args.lazy_chain
+    checkpoints = {}
+    for checkpoint in args.checkpoint:
+        height, _, block_hash = checkpoint.partition(':')
+        checkpoints[int(height)] = block_hash
+    template = TemplateBuilder(args.block_policy, args.max_block_transactions, args.max_block_size)
+    broadcaster = Broadcaster(args.broadcast_timeout, asynchronous=args.async_broadcast, binary=args.binary)
     wallet = Wallet(port)
-    blockchain = Blockchain(wallet.public_key, port)
-    app.run(host='0.0.0.0', port=port)
+    blockchain = Blockchain(wallet.public_key, port, miner, block_time, broadcaster, lazy_chain, checkpoints, template)
+    if args.continuous_mining:
+        continuous_miner = ContinuousMiner(blockchain)
+        continuous_miner.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
 
@@ -0,0 +1,270 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+
+
+# Maximum size of a single block log segment before a new segment is started
+SEGMENT_SIZE = 16 * 1024 * 1024
+# Index record: segment number, offset within the segment, length of the record
+INDEX_RECORD = struct.Struct('<IQI')
+
+
+class BlockStorage:
+    """Append-only, crash-safe storage for the blockchain, open transactions and peer nodes of a node.
+
+    Every block is appended as one encoded record to a segmented log and located through a fixed size offset index,
+    so saving a block costs the same regardless of the length of the chain. The store does not interpret the
+    records (blocks written by older versions are JSON lines, newer ones use utility.binary_codec). Segments are
+    read through memory maps, so reading a single block neither opens nor reads its segment file. Open transactions,
+    peer nodes and the latest snapshot of derived state are small and are kept in separate files which are replaced
+    atomically.
+
+    Attributes:
+        :directory: The directory holding the store (blockchain-<node_id>).
+        :legacy_file: The single file format used by older versions (blockchain-<node_id>.txt).
+        :segment_size: The size after which a new log segment is started.
+        :index (private): The in-memory copy of the offset index.
+        :maps (private): Mapping of segment number to a read-only memory map of the segment.
+        :maps_lock (private): Lets several threads read blocks at the same time while maps are replaced.
+    """
+    def __init__(self, node_id, segment_size=SEGMENT_SIZE):
+        self.directory = 'blockchain-{}'.format(node_id)
+        self.legacy_file = 'blockchain-{}.txt'.format(node_id)
+        self.segment_size = segment_size
+        self.__index = []
+        self.__maps = {}
+        self.__maps_lock = threading.Lock()
+        self.migrate()
+        os.makedirs(self.directory, exist_ok=True)
+        self.__recover()
+
+    def __len__(self):
+        return len(self.__index)
+
+    def __path(self, name, directory=None):
+        return os.path.join(directory or self.directory, name)
+
+    @staticmethod
+    def __segment_name(segment):
+        return 'blocks-{:05d}.log'.format(segment)
+
+    @staticmethod
+    def __fsync_directory(directory):
+        """Persist renames and newly created files in a directory (not supported on every platform)."""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def __write_atomic(self, name, data, directory=None):
+        """Replace a file by writing a temporary file, syncing it and renaming it over the original."""
+        directory = directory or self.directory
+        path = self.__path(name, directory)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode='w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.__fsync_directory(directory)
+
+    def __read_json(self, name, default):
+        try:
+            with open(self.__path(name), mode='r') as f:
+                return json.loads(f.read())
+        except (IOError, ValueError):
+            return default
+
+    def __map(self, segment, end):
+        """Return a memory map of a segment which covers at least the first end bytes of it.
+
+        Segments grow while blocks are appended, so a map which is too short is replaced by a new one.
+        """
+        segment_map = self.__maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            if segment_map is not None:
+                segment_map.close()
+            with open(self.__path(self.__segment_name(segment)), mode='rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__maps[segment] = segment_map
+        return segment_map
+
+    def __close_maps(self):
+        """Close all memory maps (segments must not be mapped while they are truncated or removed)."""
+        for segment_map in self.__maps.values():
+            segment_map.close()
+        self.__maps = {}
+
+    def __recover(self):
+        """Load the offset index and drop anything a crash may have left half written."""
+        index_path = self.__path('blocks.idx')
+        try:
+            with open(index_path, mode='rb') as f:
+                data = f.read()
+        except IOError:
+            data = b''
+        # A torn index record at the end is dropped
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        index = [INDEX_RECORD.unpack_from(data, pos) for pos in range(0, usable, INDEX_RECORD.size)]
+        # Records that point past the end of their segment were not fully written
+        sizes = {}
+        valid = 0
+        for segment, offset, length in index:
+            if segment not in sizes:
+                try:
+                    sizes[segment] = os.path.getsize(self.__path(self.__segment_name(segment)))
+                except OSError:
+                    sizes[segment] = 0
+            if offset + length > sizes[segment]:
+                break
+            valid += 1
+        self.__index = index[:valid]
+        if valid * INDEX_RECORD.size != len(data):
+            with open(index_path, mode='ab') as f:
+                f.truncate(valid * INDEX_RECORD.size)
+                os.fsync(f.fileno())
+        self.__truncate_segments()
+
+    def __truncate_segments(self):
+        """Cut the log after the last indexed record and remove segments which are no longer referenced."""
+        with self.__maps_lock:
+            self.__close_maps()
+        if self.__index:
+            last_segment, offset, length = self.__index[-1]
+            end = offset + length
+        else:
+            last_segment, end = 0, 0
+        for name in os.listdir(self.directory):
+            if not (name.startswith('blocks-') and name.endswith('.log')):
+                continue
+            segment = int(name[len('blocks-'):-len('.log')])
+            path = self.__path(name)
+            if segment > last_segment:
+                os.remove(path)
+            elif segment == last_segment and os.path.getsize(path) > end:
+                with open(path, mode='ab') as f:
+                    f.truncate(end)
+                    os.fsync(f.fileno())
+
+    def append_block(self, record):
+        """Append a block to the log and record its location in the index.
+
+        Arguments:
+            :record: The encoded block as bytes.
+        """
+        if self.__index:
+            segment, offset, length = self.__index[-1]
+            offset += length
+            if offset + len(record) > self.segment_size:
+                segment, offset = segment + 1, 0
+        else:
+            segment, offset = 0, 0
+        # The record has to be durable before the index points to it
+        with open(self.__path(self.__segment_name(segment)), mode='ab') as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        entry = (segment, offset, len(record))
+        with open(self.__path('blocks.idx'), mode='ab') as f:
+            f.write(INDEX_RECORD.pack(*entry))
+            f.flush()
+            os.fsync(f.fileno())
+        self.__index.append(entry)
+
+    def read_block(self, height):
+        """Return the encoded block stored at a height."""
+        segment, offset, length = self.__index[height]
+        with self.__maps_lock:
+            return self.__map(segment, offset + length)[offset:offset + length]
+
+    def read_blocks(self, start=0):
+        """Yield all encoded blocks from a height onwards."""
+        for height in range(start, len(self.__index)):
+            yield self.read_block(height)
+
+    def truncate(self, height):
+        """Remove all blocks from a height onwards (e.g. when the chain was replaced by a peer's chain)."""
+        if height >= len(self.__index):
+            return
+        del self.__index[height:]
+        with open(self.__path('blocks.idx'), mode='ab') as f:
+            f.truncate(height * INDEX_RECORD.size)
+            os.fsync(f.fileno())
+        self.__truncate_segments()
+
+    def load_open_transactions(self):
+        """Return the stored open transactions as a list of dictionaries."""
+        return self.__read_json('open_transactions.json', [])
+
+    def save_open_transactions(self, transactions):
+        """Atomically replace the stored open transactions."""
+        self.__write_atomic('open_transactions.json', json.dumps(transactions))
+
+    def load_snapshot(self):
+        """Return the stored snapshot of derived state as a dictionary (or None if there is none)."""
+        return self.__read_json('snapshot.json', None)
+
+    def save_snapshot(self, snapshot):
+        """Atomically replace the stored snapshot of derived state."""
+        self.__write_atomic('snapshot.json', json.dumps(snapshot))
+
+    def load_peer_nodes(self):
+        """Return the stored peer nodes as a list."""
+        return self.__read_json('peers.json', [])
+
+    def save_peer_nodes(self, peer_nodes):
+        """Atomically replace the stored peer nodes."""
+        self.__write_atomic('peers.json', json.dumps(list(peer_nodes)))
+
+    def migrate(self):
+        """Convert the legacy three line file (chain, open transactions, peer nodes) into a store.
+
+        The store is built in a temporary directory which is renamed into place once it is complete, so an
+        interrupted migration is simply repeated on the next start. The legacy file is kept as <name>.migrated.
+        """
+        if not os.path.isfile(self.legacy_file):
+            return
+        if not os.path.isdir(self.directory):
+            with open(self.legacy_file, mode='r') as f:
+                file_content = f.readlines()
+            tmp_directory = self.directory + '.tmp'
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            os.makedirs(tmp_directory)
+            chain = json.loads(file_content[0]) if len(file_content) > 0 else []
+            open_transactions = json.loads(file_content[1]) if len(file_content) > 1 else []
+            peer_nodes = json.loads(file_content[2]) if len(file_content) > 2 else []
+            self.__write_atomic('open_transactions.json', json.dumps(open_transactions), tmp_directory)
+            self.__write_atomic('peers.json', json.dumps(peer_nodes), tmp_directory)
+            segment, offset = 0, 0
+            with open(self.__path('blocks.idx', tmp_directory), mode='wb') as index_file:
+                log_file = open(self.__path(self.__segment_name(segment), tmp_directory), mode='wb')
+                try:
+                    for block in chain:
+                        record = (json.dumps(block) + '\n').encode('utf8')
+                        if offset and offset + len(record) > self.segment_size:
+                            log_file.flush()
+                            os.fsync(log_file.fileno())
+                            log_file.close()
+                            segment, offset = segment + 1, 0
+                            log_file = open(self.__path(self.__segment_name(segment), tmp_directory), mode='wb')
+                        log_file.write(record)
+                        index_file.write(INDEX_RECORD.pack(segment, offset, len(record)))
+                        offset += len(record)
+                    log_file.flush()
+                    os.fsync(log_file.fileno())
+                finally:
+                    log_file.close()
+                index_file.flush()
+                os.fsync(index_file.fileno())
+            self.__fsync_directory(tmp_directory)
+            os.rename(tmp_directory, self.directory)
+        os.replace(self.legacy_file, self.legacy_file + '.migrated')
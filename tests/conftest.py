@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The modules of the node live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from block import Block
+from broadcast import Broadcaster
+from transaction import Transaction
+from utility.verification import Verification
+from wallet import Wallet
+
+
+class PeerBroadcaster(Broadcaster):
+    """Answers the requests resolve sends to peer nodes from Blockchain objects in the same process.
+
+    Attributes:
+        :peers: Mapping of node address to the Blockchain answering for it.
+    """
+    def __init__(self, peers):
+        super().__init__()
+        self.peers = peers
+
+    def post(self, nodes, path, payload):
+        return {}
+
+    def get_json(self, node, path, params=None):
+        peer = self.peers[node]
+        params = params or {}
+        if path == '/chain/head':
+            return {'height': peer.height, 'hash': peer.tip.hash, 'index': peer.tip.index}
+        if path == '/chain/headers':
+            return [block.to_header() for block in peer.chain_view[params['from']:params['to']]]
+        if path == '/blocks':
+            return [block.to_dict() for block in peer.chain_view[params['from']:params['from'] + params['limit']]]
+        raise ValueError(path)
+
+    def get(self, node, path, params=None, accept=None):
+        broadcaster = self
+
+        class Response:
+            headers = {'Content-Type': 'application/json'}
+
+            def json(self):
+                return broadcaster.get_json(node, path, params)
+        return Response()
+
+
+def legacy_chain(recipient, length):
+    """Build a chain the way older versions mined it (version 1 blocks, proof of work over the transactions).
+
+    Older versions took the timestamp once per process, so every block a node mined got the same timestamp. The
+    first blocks are mined by one node, then two nodes take turns, so the timestamps also run backwards.
+    """
+    chain = [Block(0, '', [], 100, 0)]
+    for index in range(1, length):
+        timestamp = 2000.5 if index <= length // 2 or index % 2 else 1500.25
+        block = Block(index, chain[-1].hash, [Transaction('MINING', recipient, '', 10)], 0, timestamp)
+        while not Verification.valid_block_proof(block):
+            block.proof += 1
+        chain.append(block)
+    return chain
+
+
+def write_legacy_file(node_id, chain, peer_nodes=()):
+    """Write a chain to the single file older versions stored it in (see BlockStorage.migrate)."""
+    with open('blockchain-{}.txt'.format(node_id), mode='w') as f:
+        f.write(json.dumps([block.to_dict() for block in chain]) + '\n')
+        f.write(json.dumps([]) + '\n')
+        f.write(json.dumps(list(peer_nodes)))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in its own directory, since block stores and wallets are created in the working directory."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_wallet():
+    def make(node_id):
+        wallet = Wallet(node_id)
+        wallet.create_keys()
+        return wallet
+    return make
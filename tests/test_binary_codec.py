@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from block import Block, BLOCK_VERSION
+from blockchain import Blockchain
+from transaction import Transaction
+from utility.binary_codec import (encode_block, decode_block, decode_stored_block, encode_blocks, decode_blocks,
+                                  encode_transaction, decode_transaction, encode_transactions, decode_transactions)
+
+
+@pytest.fixture
+def transactions(make_wallet):
+    wallet = make_wallet(1)
+    return [
+        Transaction(wallet.public_key, 'bob', wallet.sign_transaction(wallet.public_key, 'bob', 2.5), 2.5),
+        Transaction(wallet.public_key, 'carol', wallet.sign_transaction(wallet.public_key, 'carol', 1, fee=0.25), 1, 0.25),
+        Transaction('MINING', wallet.public_key, '', 10.25),
+    ]
+
+
+@pytest.mark.parametrize('intern_keys', [True, False])
+@pytest.mark.parametrize('version', [1, BLOCK_VERSION])
+def test_block_round_trip(transactions, intern_keys, version):
+    block = Block(3, 'ab' * 32, transactions, 12345, 1700000000.5, difficulty=9, version=version)
+    decoded = decode_block(encode_block(block, intern_keys))
+    assert decoded.to_dict() == block.to_dict()
+    assert decoded.hash == block.hash
+    assert [tx.id for tx in decoded.transactions] == [tx.id for tx in block.transactions]
+
+
+def test_numbers_keep_their_type(transactions):
+    block = Block(1, 'ab' * 32, transactions[:1] + [Transaction('MINING', 'alice', '', 10)], 7, 1000)
+    decoded = decode_block(encode_block(block))
+    assert isinstance(decoded.timestamp, int) and isinstance(decoded.transactions[1].amount, int)
+    assert isinstance(decoded.transactions[0].amount, float)
+
+
+def test_genesis_block_round_trip():
+    genesis = Block(0, '', [], 100, 0)
+    assert decode_block(encode_block(genesis)).hash == genesis.hash
+
+
+def test_json_records_of_older_versions_are_decoded(transactions):
+    block = Block(2, 'cd' * 32, transactions, 99, 1000.0)
+    record = (json.dumps(block.to_dict()) + '\n').encode('utf8')
+    assert decode_stored_block(record).hash == block.hash
+    assert decode_stored_block(encode_block(block)).hash == block.hash
+    # Blocks of peer nodes have to be binary
+    with pytest.raises(ValueError):
+        decode_block(record)
+
+
+@pytest.mark.parametrize('data', [b'{}', b'{"index": 1}', b'{"transactions": 5}', b'{not json'])
+def test_malformed_json_records_raise_value_error(data):
+    with pytest.raises(ValueError):
+        decode_stored_block(data)
+
+
+def test_transaction_round_trip(transactions):
+    for tx in transactions:
+        assert decode_transaction(encode_transaction(tx)).to_dict() == tx.to_dict()
+    assert [tx.id for tx in decode_transactions(encode_transactions(transactions))] == [tx.id for tx in transactions]
+
+
+def test_block_stream_round_trip(transactions):
+    blocks = [Block(0, '', [], 100, 0), Block(1, 'ab' * 32, transactions, 5, 1000.0, version=BLOCK_VERSION)]
+    assert [block.hash for block in decode_blocks(b''.join(encode_blocks(blocks)))] == [block.hash for block in blocks]
+
+
+@pytest.mark.parametrize('data', [b'', b'\x02', b'\x01\x05'])
+def test_malformed_data_raises_value_error(transactions, data):
+    with pytest.raises(ValueError):
+        decode_block(data)
+
+
+def test_truncated_block_raises_value_error(transactions):
+    with pytest.raises(ValueError):
+        decode_block(encode_block(Block(1, 'ab' * 32, transactions, 5, 1000.0))[:-3])
+
+
+@pytest.mark.parametrize('changes', [{'index': 1.0}, {'index': True}, {'difficulty': 8.0}, {'version': '2'},
+                                     {'transactions': [{'sender': 'alice'}]}, {'transactions': 5}])
+def test_malformed_block_dicts_raise_value_error(transactions, changes):
+    block = Block(1, 'ab' * 32, transactions, 5, 1000.0).to_dict()
+    block.update(changes)
+    with pytest.raises(ValueError):
+        Block.from_dict(block)
+
+
+def test_block_dicts_with_missing_fields_raise_value_error():
+    with pytest.raises(ValueError):
+        Block.from_dict({'index': 3})
+
+
+def test_blocks_which_can_not_be_stored_are_declined(make_wallet):
+    wallet = make_wallet(1)
+    miner = Blockchain(wallet.public_key, 1)
+    receiver = Blockchain(wallet.public_key, 2)
+    block = miner.mine_block().to_dict()
+    for changes in ({'index': 1.0}, {'index': 2}, {'proof': str(block['proof'])}):
+        assert not receiver.add_block(dict(block, **changes))
+    assert receiver.add_block(block)
+    assert receiver.mine_block() is not None
+    assert Blockchain(wallet.public_key, 2).height == 3
@@ -0,0 +1,100 @@
+from block import Block
+from block_template import TemplateBuilder
+from blockchain import Blockchain
+from utility.verification import Verification
+
+from conftest import PeerBroadcaster
+
+
+def test_balances_match_chain_after_mining(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    blockchain = Blockchain(alice.public_key, 1)
+    assert blockchain.mine_block() is not None
+    signature = alice.sign_transaction(alice.public_key, bob.public_key, 3, fee=0.5)
+    assert blockchain.add_transaction(bob.public_key, alice.public_key, signature, 3, fee=0.5)
+    assert blockchain.verify_balances()
+    assert blockchain.mine_block() is not None
+    assert blockchain.verify_balances()
+    assert blockchain.get_balance(bob.public_key) == 3
+    assert blockchain.get_balance() == 17
+
+
+def test_balances_match_chain_after_adding_peer_blocks(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    miner = Blockchain(alice.public_key, 1)
+    receiver = Blockchain(bob.public_key, 2)
+    for _ in range(3):
+        block = miner.mine_block()
+        assert receiver.add_block(block.to_dict())
+    assert receiver.verify_balances()
+    assert receiver.get_balance(alice.public_key) == 30
+    assert Verification.verify_chain(receiver.chain, receiver.block_time)
+
+
+def test_balances_match_chain_after_resolve(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    peers = {}
+    local = Blockchain(alice.public_key, 1, broadcaster=PeerBroadcaster(peers))
+    peer = Blockchain(bob.public_key, 2, broadcaster=PeerBroadcaster(peers))
+    peers['peer'] = peer
+    for _ in range(2):
+        assert peer.add_block(local.mine_block().to_dict())
+    # Both chains diverge after the shared blocks, the peer's chain took more work
+    local.mine_block()
+    for _ in range(3):
+        peer.mine_block()
+    local.add_peer_node('peer')
+    assert local.resolve()
+    assert [block.hash for block in local.chain] == [block.hash for block in peer.chain]
+    assert local.verify_balances()
+    assert local.get_balance() == 20
+    assert local.last_resolve_report['winner'] == 'peer'
+    # The replaced chain is what a restarted node loads
+    restarted = Blockchain(alice.public_key, 1)
+    assert restarted.tip.hash == peer.tip.hash
+    assert restarted.verify_balances()
+
+
+def test_block_with_wrong_reward_is_declined(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    miner = Blockchain(alice.public_key, 1)
+    receiver = Blockchain(bob.public_key, 2)
+    block = miner.mine_block().to_dict()
+    block['transactions'][-1]['amount'] = 1000
+    assert not receiver.add_block(block)
+    # The reward has to carry the index of its block
+    block = miner.chain[1].to_dict()
+    block['transactions'][-1]['signature'] = '2'
+    assert not Verification.valid_reward(Block.from_dict(block))
+    assert not Verification.verify_chain(miner.chain[:1] + [Block.from_dict(block)], miner.block_time)
+
+
+def test_resolve_declines_chain_with_oversized_blocks(make_wallet):
+    alice, bob, carol = make_wallet(1), make_wallet(2), make_wallet(3)
+    peers = {}
+    local = Blockchain(alice.public_key, 1, broadcaster=PeerBroadcaster(peers), template=TemplateBuilder(max_transactions=1))
+    peer = Blockchain(bob.public_key, 2, broadcaster=PeerBroadcaster(peers))
+    peers['peer'] = peer
+    assert local.add_block(peer.mine_block().to_dict())
+    for amount in (1, 2):
+        signature = bob.sign_transaction(bob.public_key, carol.public_key, amount)
+        assert peer.add_transaction(carol.public_key, bob.public_key, signature, amount)
+    block = peer.mine_block()
+    assert len(block.transactions) == 3
+    assert not local.add_block(block.to_dict())
+    local.add_peer_node('peer')
+    assert not local.resolve()
+    assert local.last_resolve_report['invalid'] == ['peer']
+    assert local.height == 2
+
+
+def test_block_on_a_fork_requests_resolving(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    local = Blockchain(alice.public_key, 1)
+    peer = Blockchain(bob.public_key, 2)
+    assert local.add_block(peer.mine_block().to_dict())
+    local.mine_block()
+    assert not local.resolve_conflicts
+    # The peer's next block builds on the shared block, not on the local tip
+    assert not local.add_block(peer.mine_block().to_dict())
+    assert local.resolve_conflicts
@@ -0,0 +1,144 @@
+import pytest
+
+from block import Block, BLOCK_VERSION
+from blockchain import Blockchain
+from transaction import Transaction
+from utility.binary_codec import encode_block, decode_block
+from utility.difficulty import (DEFAULT_DIFFICULTY, MAX_ADJUSTMENT, MAX_DIFFICULTY, MAX_FUTURE_DRIFT, MIN_DIFFICULTY,
+                                RETARGET_INTERVAL, chain_work, follows_legacy_rules, median_time_past, next_difficulty,
+                                valid_difficulty, valid_timestamp)
+from utility.verification import Verification
+
+from conftest import PeerBroadcaster, legacy_chain, write_legacy_file
+
+
+@pytest.mark.parametrize('difficulty', [MIN_DIFFICULTY, 8, MAX_DIFFICULTY])
+def test_valid_difficulties(difficulty):
+    assert valid_difficulty(difficulty)
+
+
+@pytest.mark.parametrize('difficulty', [0, MAX_DIFFICULTY + 1, 10 ** 10, 8.0, 1e308, '8', True, None])
+def test_invalid_difficulties_are_rejected_when_decoding(difficulty):
+    assert not valid_difficulty(difficulty)
+    block = Block(1, 'ab' * 32, [], 5, 1000.0).to_dict()
+    block['difficulty'] = difficulty
+    with pytest.raises(ValueError):
+        Block.from_dict(block)
+
+
+def test_binary_blocks_with_invalid_difficulty_are_rejected():
+    with pytest.raises(ValueError):
+        decode_block(encode_block(Block(1, 'ab' * 32, [], 5, 1000.0, difficulty=10 ** 10)))
+
+
+def test_resolve_declines_peer_with_invalid_difficulty(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    local = Blockchain(alice.public_key, 1)
+
+    class HugeDifficultyBroadcaster(PeerBroadcaster):
+        def get_json(self, node, path, params=None):
+            result = super().get_json(node, path, params)
+            if path == '/blocks':
+                for block in result:
+                    block['difficulty'] = 1e308
+            return result
+    peer = Blockchain(bob.public_key, 2)
+    local.broadcaster = HugeDifficultyBroadcaster({'peer': peer})
+    for _ in range(2):
+        peer.mine_block()
+    local.add_peer_node('peer')
+    assert not local.resolve()
+    assert local.last_resolve_report['invalid'] == ['peer']
+
+
+def test_fresh_node_syncs_legacy_chain(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    write_legacy_file(1, legacy_chain(alice.public_key, 25))
+    peers = {}
+    peer = Blockchain(alice.public_key, 1, broadcaster=PeerBroadcaster(peers))
+    peer.mine_block()
+    peers['peer'] = peer
+    local = Blockchain(bob.public_key, 2, broadcaster=PeerBroadcaster(peers))
+    local.add_peer_node('peer')
+    assert local.resolve()
+    assert local.tip.hash == peer.tip.hash
+    assert Verification.verify_chain(local.chain, local.block_time)
+
+
+def test_block_versions_do_not_decrease(make_wallet):
+    wallet = make_wallet(1)
+    blockchain = Blockchain(wallet.public_key, 1)
+    blockchain.mine_block()
+    tip = blockchain.tip
+    # A version 1 block at the default difficulty must not escape the rules of the chain
+    block = Block(2, tip.hash, [Transaction('MINING', wallet.public_key, '', 10)], 0, tip.timestamp + 1)
+    while not Verification.valid_block_proof(block):
+        block.proof += 1
+    assert not follows_legacy_rules(blockchain.chain, block)
+    assert not blockchain.add_block(block.to_dict())
+    assert not Verification.verify_chain(blockchain.chain + [block], blockchain.block_time)
+
+
+def _chain(timestamps, difficulty=8, version=BLOCK_VERSION):
+    """Build blocks with the given timestamps after a genesis block (only the fields the rules read matter)."""
+    chain = [Block(0, '', [], 100, 0)]
+    for index, timestamp in enumerate(timestamps, start=1):
+        chain.append(Block(index, chain[-1].hash, [], 0, timestamp, difficulty, version))
+    return chain
+
+
+def test_difficulty_is_kept_between_retargets():
+    # Blocks this fast would raise the difficulty, but only at the end of every window after the first one
+    chain = _chain([1000 + index for index in range(1, 3 * RETARGET_INTERVAL)], difficulty=12)
+    # Height 1 follows the genesis block, which has the default difficulty
+    for height in range(2, len(chain) + 1):
+        expected = 12 + MAX_ADJUSTMENT if height == 2 * RETARGET_INTERVAL + 1 else 12
+        assert next_difficulty(chain, height=height) == expected
+
+
+@pytest.mark.parametrize('block_seconds, adjustment', [(60, 0), (30, 1), (15, 2), (1, MAX_ADJUSTMENT), (120, -1), (600, -MAX_ADJUSTMENT)])
+def test_difficulty_follows_block_time(block_seconds, adjustment):
+    chain = _chain([1000 + block_seconds * index for index in range(1, 2 * RETARGET_INTERVAL + 1)], difficulty=12)
+    assert next_difficulty(chain, block_time=60) == 12 + adjustment
+
+
+def test_difficulty_stays_within_bounds():
+    fast = _chain([1000 + index for index in range(1, 2 * RETARGET_INTERVAL + 1)], difficulty=MAX_DIFFICULTY)
+    assert next_difficulty(fast) == MAX_DIFFICULTY
+    slow = _chain([1000 + 3600 * index for index in range(1, 2 * RETARGET_INTERVAL + 1)], difficulty=MIN_DIFFICULTY)
+    assert next_difficulty(slow) == MIN_DIFFICULTY
+
+
+def test_windows_of_older_versions_are_not_retargeted():
+    # Older versions gave all blocks of a node the same timestamp, which would look like infinitely fast blocks
+    chain = _chain([2000.5] * 2 * RETARGET_INTERVAL, version=1)
+    assert next_difficulty(chain) == DEFAULT_DIFFICULTY
+    assert next_difficulty(_chain([2000.5] * 2 * RETARGET_INTERVAL)) == DEFAULT_DIFFICULTY + MAX_ADJUSTMENT
+
+
+def test_timestamp_has_to_be_later_than_the_median():
+    chain = _chain([1000, 1010, 1020, 1030, 1040])
+    # The genesis block is part of the window as well
+    assert median_time_past(chain) == 1015
+    candidate = Block(6, chain[-1].hash, [], 0, 1016, version=BLOCK_VERSION)
+    assert valid_timestamp(chain, candidate, now=2000)
+    for timestamp in (1015, 1000, '1050', None):
+        candidate.timestamp = timestamp
+        assert not valid_timestamp(chain, candidate, now=2000)
+
+
+def test_timestamp_may_not_be_far_ahead():
+    chain = _chain([1000])
+    assert valid_timestamp(chain, Block(2, chain[-1].hash, [], 0, 1000 + MAX_FUTURE_DRIFT, version=BLOCK_VERSION), now=1000)
+    assert not valid_timestamp(chain, Block(2, chain[-1].hash, [], 0, 1001 + MAX_FUTURE_DRIFT, version=BLOCK_VERSION), now=1000)
+
+
+def test_timestamps_of_older_versions_may_run_backwards():
+    chain = _chain([2000.5, 2000.5, 1500.25], version=1)
+    assert valid_timestamp(chain, Block(4, chain[-1].hash, [], 0, 1500.25), now=3000)
+    assert not valid_timestamp(chain, Block(4, chain[-1].hash, [], 0, 1500.25, version=BLOCK_VERSION), now=3000)
+    assert not valid_timestamp(chain, Block(4, chain[-1].hash, [], 0, 3000 + MAX_FUTURE_DRIFT + 1), now=3000)
+
+
+def test_chain_work_counts_difficulty():
+    assert chain_work(_chain([1000] * 3, difficulty=10)[1:]) > chain_work(_chain([1000] * 6, difficulty=8)[1:])
@@ -0,0 +1,51 @@
+from blockchain import Blockchain
+from mempool import Mempool
+from transaction import Transaction
+
+
+def _transaction(sender, amount):
+    return Transaction(sender, 'bob', 'ab' * 4, amount)
+
+
+def test_duplicates_are_rejected():
+    mempool = Mempool()
+    tx = _transaction('alice', 1)
+    assert mempool.add(tx) == []
+    assert mempool.add(_transaction('alice', 1)) is None
+    assert len(mempool) == 1 and mempool.version == 1
+
+
+def test_oldest_transactions_are_evicted():
+    mempool = Mempool(max_size=3)
+    transactions = [_transaction('alice' if amount % 2 else 'carol', amount) for amount in range(1, 6)]
+    evicted = []
+    for tx in transactions:
+        evicted.extend(mempool.add(tx))
+    assert evicted == transactions[:2]
+    assert mempool.get_transactions() == transactions[2:]
+    assert mempool.get_sender_transactions('alice') == [transactions[2], transactions[4]]
+    assert mempool.get_sender_transactions('carol') == [transactions[3]]
+    assert mempool.get(transactions[0].id) is None
+
+
+def test_confirmed_transactions_are_removed():
+    transactions = [_transaction('alice', amount) for amount in range(1, 4)]
+    mempool = Mempool(transactions)
+    version = mempool.version
+    removed = mempool.remove_confirmed([transactions[1], _transaction('dave', 9)])
+    assert removed == [transactions[1]]
+    assert mempool.get_transactions() == [transactions[0], transactions[2]]
+    assert mempool.version == version + 1
+    mempool.clear()
+    assert len(mempool) == 0 and mempool.get_sender_transactions('alice') == []
+
+
+def test_blockchain_rejects_relayed_duplicates(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    blockchain = Blockchain(alice.public_key, 1)
+    blockchain.mine_block()
+    signature = alice.sign_transaction(alice.public_key, bob.public_key, 2)
+    assert blockchain.add_transaction(bob.public_key, alice.public_key, signature, 2)
+    assert not blockchain.add_transaction(bob.public_key, alice.public_key, signature, 2, is_receiving=True)
+    assert len(blockchain.get_open_transactions()) == 1
+    assert blockchain.verify_balances()
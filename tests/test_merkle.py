@@ -0,0 +1,72 @@
+import hashlib
+
+import pytest
+
+from blockchain import Blockchain
+from utility.merkle import EMPTY_ROOT, merkle_root, merkle_proof, verify_merkle_proof
+
+
+TX_IDS = [hashlib.sha256(bytes([i])).hexdigest() for i in range(11)]
+
+
+def test_empty_tree():
+    assert merkle_root([]) == EMPTY_ROOT
+
+
+@pytest.mark.parametrize('count', range(1, len(TX_IDS) + 1))
+def test_every_transaction_has_a_valid_proof(count):
+    tx_ids = TX_IDS[:count]
+    root = merkle_root(tx_ids)
+    for position, tx_id in enumerate(tx_ids):
+        assert verify_merkle_proof(tx_id, merkle_proof(tx_ids, position), root)
+
+
+@pytest.mark.parametrize('count', range(2, len(TX_IDS) + 1))
+def test_proof_does_not_fit_other_transactions(count):
+    tx_ids = TX_IDS[:count]
+    root = merkle_root(tx_ids)
+    proof = merkle_proof(tx_ids, 0)
+    assert not verify_merkle_proof(tx_ids[1], proof, root)
+    assert not verify_merkle_proof(TX_IDS[0], proof, merkle_root(tx_ids[1:] + tx_ids[:1]))
+
+
+def test_repeated_last_transaction_changes_root():
+    assert merkle_root(TX_IDS[:3]) != merkle_root(TX_IDS[:3] + TX_IDS[2:3])
+
+
+def test_combined_node_is_not_accepted_as_transaction():
+    root = merkle_root(TX_IDS[:4])
+    combined = merkle_root(TX_IDS[:2])
+    assert not verify_merkle_proof(combined, [{'hash': merkle_root(TX_IDS[2:4]), 'side': 'right'}], root)
+
+
+def test_malformed_proof_is_rejected():
+    root = merkle_root(TX_IDS[:4])
+    assert not verify_merkle_proof(TX_IDS[0], [{'hash': 'zz', 'side': 'right'}], root)
+    assert not verify_merkle_proof(TX_IDS[0], [{'hash': TX_IDS[1], 'side': 'up'}], root)
+    assert not verify_merkle_proof(TX_IDS[0], [{'side': 'right'}], root)
+    with pytest.raises(IndexError):
+        merkle_proof(TX_IDS[:4], 4)
+
+
+def test_inclusion_proof_of_mined_transaction(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    blockchain = Blockchain(alice.public_key, 1)
+    blockchain.mine_block()
+    signature = alice.sign_transaction(alice.public_key, bob.public_key, 2)
+    assert blockchain.add_transaction(bob.public_key, alice.public_key, signature, 2)
+    block = blockchain.mine_block()
+    tx_id = block.transactions[0].id
+    found_block, position, proof = blockchain.get_inclusion_proof(tx_id)
+    assert found_block.hash == block.hash and position == 0
+    assert verify_merkle_proof(tx_id, proof, block.merkle_root)
+    assert blockchain.get_inclusion_proof(tx_id, height=1) is None
+
+
+def test_rewards_are_unique_per_block(make_wallet):
+    wallet = make_wallet(1)
+    blockchain = Blockchain(wallet.public_key, 1)
+    first, second = blockchain.mine_block(), blockchain.mine_block()
+    assert first.transactions[-1].id != second.transactions[-1].id
+    assert first.merkle_root != second.merkle_root
+    assert blockchain.get_inclusion_proof(first.transactions[-1].id)[0].hash == first.hash
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from blockchain import Blockchain
+from miner import Miner
+from mining_jobs import MiningJobs, ContinuousMiner
+
+
+class GatedMiner(Miner):
+    """Searches the proof of work only once the gate is open, reporting progress until then."""
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.searches = 0
+
+    def search(self, prefix, difficulty, progress=None):
+        self.searches += 1
+        hashes = 0
+        while not self.gate.wait(0.01):
+            hashes += 100
+            if progress is not None and progress(hashes):
+                return None
+        return super().search(prefix, difficulty, progress)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'Timed out'
+        time.sleep(0.01)
+
+
+def test_job_starts_over_when_a_block_arrives(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    miner = GatedMiner()
+    blockchain = Blockchain(alice.public_key, 1, miner=miner)
+    peer = Blockchain(bob.public_key, 2)
+    job = MiningJobs().start(blockchain)
+    wait_for(lambda: job.hashes > 0)
+    assert job.status == 'running'
+    assert blockchain.add_block(peer.mine_block().to_dict())
+    wait_for(lambda: job.restarts == 1 and miner.searches == 2)
+    assert job.status == 'running'
+    miner.gate.set()
+    assert job.wait(10)
+    assert job.status == 'done'
+    assert job.block.index == 2 and job.block.previous_hash == peer.tip.hash
+    assert blockchain.tip.hash == job.block.hash
+
+
+def test_cancelled_job_adds_no_block(make_wallet):
+    wallet = make_wallet(1)
+    blockchain = Blockchain(wallet.public_key, 1, miner=GatedMiner())
+    jobs = MiningJobs()
+    job = jobs.start(blockchain)
+    assert jobs.get(job.id) is job
+    wait_for(lambda: job.hashes > 0)
+    job.cancel()
+    assert job.wait(10)
+    assert job.status == 'cancelled' and job.block is None
+    assert blockchain.height == 1
+
+
+def test_continuous_miner_starts_over_on_new_blocks_and_transactions(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    miner = GatedMiner()
+    blockchain = Blockchain(alice.public_key, 1, miner=miner)
+    peer = Blockchain(bob.public_key, 2)
+    assert blockchain.add_block(peer.mine_block().to_dict())
+    continuous_miner = ContinuousMiner(blockchain, min_template_age=0)
+    continuous_miner.start()
+    try:
+        wait_for(lambda: continuous_miner.hashes > 0)
+        # A block of a peer node replaces the tip the template was built on
+        assert blockchain.add_block(peer.mine_block().to_dict())
+        wait_for(lambda: continuous_miner.restarts == 1 and miner.searches == 2)
+        # A new open transaction makes the template outdated
+        signature = bob.sign_transaction(bob.public_key, alice.public_key, 1)
+        assert blockchain.add_transaction(alice.public_key, bob.public_key, signature, 1)
+        wait_for(lambda: continuous_miner.restarts == 2 and miner.searches == 3)
+        assert continuous_miner.blocks == 0
+        miner.gate.set()
+        wait_for(lambda: continuous_miner.blocks >= 1)
+    finally:
+        continuous_miner.stop()
+    block = blockchain.chain[3]
+    assert block.previous_hash == peer.tip.hash
+    assert [tx.sender for tx in block.transactions] == [bob.public_key, 'MINING']
+    assert not continuous_miner.running
@@ -0,0 +1,57 @@
+import pytest
+
+import node
+from blockchain import Blockchain
+from broadcast import Broadcaster
+from miner import Miner
+from transaction import Transaction
+from utility.binary_codec import BINARY_CONTENT_TYPE, encode_transactions
+
+
+@pytest.fixture
+def client(make_wallet, monkeypatch):
+    wallet = make_wallet(5000)
+    blockchain = Blockchain(wallet.public_key, 5000)
+    for name, value in {'wallet': wallet, 'blockchain': blockchain, 'port': 5000, 'miner': Miner(), 'block_time': 60,
+                        'broadcaster': Broadcaster(), 'lazy_chain': False, 'checkpoints': {}, 'template': None}.items():
+        monkeypatch.setattr(node, name, value, raising=False)
+    return node.app.test_client()
+
+
+def _signed(wallet, recipient, amount, fee=0):
+    return Transaction(wallet.public_key, recipient, wallet.sign_transaction(wallet.public_key, recipient, amount, fee), amount, fee)
+
+
+def test_batch_answers_every_transaction(client, make_wallet):
+    miner, bob = node.wallet, make_wallet(2)
+    node.blockchain.mine_block()
+    paid = _signed(miner, bob.public_key, 3)
+    forged = Transaction(miner.public_key, bob.public_key, paid.signature, 4)
+    too_expensive = _signed(miner, bob.public_key, 8)
+    batch = [paid.to_dict(), paid.to_dict(), forged.to_dict(), too_expensive.to_dict(),
+             {'sender': miner.public_key}, dict(paid.to_dict(), amount='3'), dict(paid.to_dict(), fee='x'), 'tx']
+    response = client.post('/transactions/batch', json={'transactions': batch})
+    assert response.status_code == 201
+    assert response.get_json()['results'] == ['added', 'known', 'invalid', 'insufficient_funds',
+                                              'malformed', 'malformed', 'malformed', 'malformed']
+    # Transactions which are already open are known in later batches as well
+    response = client.post('/transactions/batch', json={'transactions': [paid.to_dict()]})
+    assert response.status_code == 200 and response.get_json()['results'] == ['known']
+    assert [tx.id for tx in node.blockchain.get_open_transactions()] == [paid.id]
+    assert node.blockchain.verify_balances()
+
+
+def test_binary_batch(client, make_wallet):
+    miner, bob = node.wallet, make_wallet(2)
+    node.blockchain.mine_block()
+    transactions = [_signed(miner, bob.public_key, amount) for amount in (1, 2)]
+    response = client.post('/transactions/batch', data=encode_transactions(transactions), content_type=BINARY_CONTENT_TYPE)
+    assert response.get_json()['results'] == ['added', 'added']
+    response = client.post('/transactions/batch', data=b'\x05', content_type=BINARY_CONTENT_TYPE)
+    assert response.status_code == 400
+
+
+def test_batch_limits(client, monkeypatch):
+    assert client.post('/transactions/batch', json={'transactions': 'tx'}).status_code == 400
+    monkeypatch.setattr(node, 'MAX_BATCH_SIZE', 2)
+    assert client.post('/transactions/batch', json={'transactions': [{}, {}, {}]}).status_code == 413
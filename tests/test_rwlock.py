@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from utility.rwlock import ReadWriteLock
+
+
+def test_locks_are_reentrant():
+    lock = ReadWriteLock()
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                pass
+        with lock.read():
+            with lock.read():
+                pass
+    # Everything was released, so another thread can write
+    acquired = threading.Event()
+
+    def write():
+        with lock.write():
+            acquired.set()
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join(5)
+    assert acquired.is_set()
+
+
+def test_read_lock_can_not_be_upgraded():
+    lock = ReadWriteLock()
+    with lock.read():
+        with pytest.raises(RuntimeError):
+            with lock.write():
+                pass
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+
+    def read():
+        with lock.read():
+            # All readers have to hold the lock at the same time to pass the barrier
+            inside.wait()
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not inside.broken
+
+
+def test_waiting_writer_is_preferred_over_new_readers():
+    lock = ReadWriteLock()
+    order = []
+    reading = threading.Event()
+    release_reader = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            reading.set()
+            release_reader.wait(5)
+
+    def writer():
+        with lock.write():
+            order.append('writer')
+
+    def late_reader():
+        with lock.read():
+            order.append('reader')
+    threads = [threading.Thread(target=first_reader)]
+    threads[0].start()
+    reading.wait(5)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    # Give the writer time to start waiting before the next reader arrives
+    time.sleep(0.1)
+    threads.append(threading.Thread(target=late_reader))
+    threads[2].start()
+    time.sleep(0.1)
+    # The late reader waits behind the writer although only a reader holds the lock
+    assert order == []
+    release_reader.set()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['writer', 'reader']
@@ -0,0 +1,74 @@
+import os
+
+from blockchain import Blockchain
+from storage import BlockStorage, INDEX_RECORD
+from utility.verification import Verification
+
+from conftest import legacy_chain, write_legacy_file
+
+
+def test_blocks_survive_reopening():
+    storage = BlockStorage(1, segment_size=64)
+    records = [b'block-%d' % height * 4 for height in range(5)]
+    for record in records:
+        storage.append_block(record)
+    reopened = BlockStorage(1, segment_size=64)
+    assert len(reopened) == 5
+    assert list(reopened.read_blocks()) == records
+    # A small segment size spreads the records over several segments
+    assert len([name for name in os.listdir(storage.directory) if name.endswith('.log')]) > 1
+
+
+def test_torn_tail_is_dropped():
+    storage = BlockStorage(1)
+    storage.append_block(b'first')
+    storage.append_block(b'second')
+    # A crash while appending leaves part of a record in the log and part of an index record
+    with open(os.path.join(storage.directory, 'blocks-00000.log'), mode='ab') as f:
+        f.write(b'thi')
+    with open(os.path.join(storage.directory, 'blocks.idx'), mode='ab') as f:
+        f.write(INDEX_RECORD.pack(0, 11, 5)[:7])
+    recovered = BlockStorage(1)
+    assert list(recovered.read_blocks()) == [b'first', b'second']
+    assert os.path.getsize(os.path.join(storage.directory, 'blocks-00000.log')) == 11
+    recovered.append_block(b'third')
+    assert list(BlockStorage(1).read_blocks()) == [b'first', b'second', b'third']
+
+
+def test_index_records_past_the_log_are_dropped():
+    storage = BlockStorage(1)
+    storage.append_block(b'first')
+    # The index record was written, but the record it points to never reached the log
+    with open(os.path.join(storage.directory, 'blocks.idx'), mode='ab') as f:
+        f.write(INDEX_RECORD.pack(0, 5, 6))
+    recovered = BlockStorage(1)
+    assert list(recovered.read_blocks()) == [b'first']
+
+
+def test_truncate_removes_blocks():
+    storage = BlockStorage(1, segment_size=16)
+    for height in range(4):
+        storage.append_block(b'record-%d' % height)
+    storage.truncate(1)
+    storage.append_block(b'replaced')
+    assert list(BlockStorage(1, segment_size=16).read_blocks()) == [b'record-0', b'replaced']
+
+
+def test_legacy_file_is_migrated(make_wallet):
+    wallet = make_wallet(1)
+    # Long enough for the blocks to span several retarget windows
+    chain = legacy_chain(wallet.public_key, 25)
+    write_legacy_file(1, chain, ['localhost:5001'])
+    blockchain = Blockchain(wallet.public_key, 1)
+    assert [block.hash for block in blockchain.chain] == [block.hash for block in chain]
+    assert Verification.verify_chain(blockchain.chain, blockchain.block_time)
+    assert blockchain.get_peer_nodes() == ['localhost:5001']
+    assert blockchain.get_balance() == 240
+    assert not os.path.exists('blockchain-1.txt')
+    assert os.path.exists('blockchain-1.txt.migrated')
+    # Blocks mined after the migration extend the old chain
+    assert blockchain.mine_block() is not None
+    restarted = Blockchain(wallet.public_key, 1)
+    assert restarted.height == 26
+    assert restarted.verify_balances()
+    assert Verification.verify_chain(restarted.chain, restarted.block_time)
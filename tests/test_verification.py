@@ -0,0 +1,37 @@
+from blockchain import Blockchain
+from transaction import Transaction
+from utility import verification
+from utility.verification import Verification
+
+
+def test_signatures_are_only_verified_for_otherwise_valid_chains(make_wallet, monkeypatch):
+    alice, bob = make_wallet(1), make_wallet(2)
+    blockchain = Blockchain(alice.public_key, 1)
+    blockchain.mine_block()
+    signature = alice.sign_transaction(alice.public_key, bob.public_key, 1)
+    assert blockchain.add_transaction(bob.public_key, alice.public_key, signature, 1)
+    blockchain.mine_block()
+    batches = []
+    verify_batch = Verification.verify_transactions_batch
+    monkeypatch.setattr(Verification, 'verify_transactions_batch',
+                        staticmethod(lambda transactions: batches.append(transactions) or verify_batch(transactions)))
+    chain = blockchain.chain
+    assert Verification.verify_chain(chain, blockchain.block_time)
+    assert len(batches) == 1 and len(batches[0]) == 1
+    chain[2].proof += 1
+    assert not Verification.verify_chain(chain, blockchain.block_time)
+    assert len(batches) == 1
+
+
+
+def test_signature_batches_are_checked_by_pool_workers_started_fresh(make_wallet):
+    alice, bob = make_wallet(1), make_wallet(2)
+    transactions = []
+    for amount in range(1, 2 * verification.BATCH_THRESHOLD + 1):
+        signature = alice.sign_transaction(alice.public_key, bob.public_key, amount)
+        transactions.append(Transaction(alice.public_key, bob.public_key, signature, amount))
+    # Workers forked from the multi-threaded server could inherit locks held by other threads
+    assert verification.POOL_START_METHOD != 'fork'
+    assert Verification.verify_signatures(transactions) == [True] * len(transactions)
+    transactions[-1].amount += 1
+    assert Verification.verify_signatures(transactions)[-1] is False
@@ -1,22 +1,87 @@
+import hashlib
+import json
 from collections import OrderedDict
 from utility.printable import Printable
 
 class Transaction(Printable):
     """A transaction which can be added to a block in the blockchain.
 
+    The id is calculated once and memoized, since it is looked up whenever the transaction is verified, added to or
+    removed from the open transactions. The other serializations are built when they are needed.
+
     Attributes:
     :sender: The sender of the coins
     :recipient: The recipient of the coins
     :signature: The signature of the transaction
     :amount: The amount of the coins sent
+    :fee: The coins the sender pays on top of the amount to the miner of the block which contains the transaction
     """
-    def __init__(self, sender, recipient ,signature, amount):
+    # The memoized id is a private slot, so it is neither printed nor part of to_dict
+    __slots__ = ('sender', 'recipient', 'amount', 'signature', 'fee', '_cached_id')
+
+    def __init__(self, sender, recipient ,signature, amount, fee=0):
         self.sender = sender
         self.recipient = recipient
         self.amount = amount
         self.signature = signature
-    
+        self.fee = fee
+        object.__setattr__(self, '_cached_id', None)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # Transactions are immutable by convention, but if a field is changed the id has to be calculated again
+        if getattr(self, '_cached_id', None) is not None:
+            object.__setattr__(self, '_cached_id', None)
+
+    @property
+    def cost(self):
+        """The coins taken from the sender's balance (amount plus fee)."""
+        return self.amount + self.fee
+
+    @property
+    def id(self):
+        """The hash of the canonical bytes (identifies the transaction including its signature)."""
+        if self._cached_id is None:
+            object.__setattr__(self, '_cached_id', hashlib.sha256(self.to_bytes()).hexdigest())
+        return self._cached_id
+
 
     def to_ordered_dict(self):
         """Converts this transaction into a (hashable) OrderedDict."""
-        return OrderedDict([('sender', self.sender),('recipient', self.recipient), ('amount', self.amount)])
+        ordered = OrderedDict([('sender', self.sender),('recipient', self.recipient), ('amount', self.amount)])
+        # Transactions without a fee are serialized as before, so existing proofs and block hashes stay valid
+        if self.fee:
+            ordered['fee'] = self.fee
+        return ordered
+
+    def to_dict(self):
+        """Converts this transaction into a dictionary (used for saving and sending it)."""
+        tx = {'sender': self.sender, 'recipient': self.recipient, 'amount': self.amount, 'signature': self.signature}
+        if self.fee:
+            tx['fee'] = self.fee
+        return tx
+
+    @classmethod
+    def from_dict(cls, tx):
+        """Create a transaction from a dictionary created by to_dict."""
+        return cls(tx['sender'], tx['recipient'], tx['signature'], tx['amount'], tx.get('fee', 0))
+
+    def signed_content(self):
+        """Return the text which is signed by the sender."""
+        content = str(self.sender) + str(self.recipient) + str(self.amount)
+        if self.fee:
+            # The separator keeps a fee from being read as more digits of the amount
+            content += '|fee:' + str(self.fee)
+        return content
+
+    def proof_content(self):
+        """Return the text of this transaction which is part of the proof of work input (see Verification.proof_prefix)."""
+        return repr(self.to_ordered_dict())
+
+    def hash_content(self):
+        """Return the JSON text of this transaction which is part of the block hash (see hash_block)."""
+        return json.dumps(self.to_ordered_dict(), sort_keys=True)
+
+    def to_bytes(self):
+        """Return the canonical byte representation of this transaction (compact JSON with sorted keys)."""
+        return json.dumps(self.to_dict(), sort_keys=True, separators=(',', ':')).encode('utf8')
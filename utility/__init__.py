@@ -1,3 +1,3 @@
-from utility.hash_util import hash_string_256
+from utility.hash_util import hash_string_256, ProofHasher
 
-__all__ = ['hash_string_256']
\ No newline at end of file
+__all__ = ['hash_string_256', 'ProofHasher']
\ No newline at end of file
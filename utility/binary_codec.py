@@ -0,0 +1,278 @@
+"""Provides a compact, versioned binary encoding for blocks and transactions.
+
+Strings which are lowercase hex (public keys, signatures, hashes) are stored as raw bytes, all other strings as UTF-8.
+Numbers keep their type (int or float), since the signatures and block hashes depend on how they are printed.
+Every length and integer is written as a variable length integer.
+
+Transaction: version, sender, recipient, amount, signature, [fee]
+Block:       version, flags, index, previous hash, timestamp, proof, difficulty, [block version, Merkle root],
+             [key table], transactions
+If the interning flag is set, all distinct senders and recipients of a block are written once in a key table and the
+transactions refer to them by their position in the table. Blocks of version 2 and later (see block.BLOCK_VERSION)
+set the Merkle root flag and carry their block version and Merkle root. If the fee flag is set, every transaction of the block is
+followed by its fee. A transaction without a fee is encoded exactly as before fees existed.
+"""
+
+import json
+import struct
+from block import Block
+from transaction import Transaction
+from utility.difficulty import valid_difficulty
+
+
+# Content type of binary encoded blocks and transactions in HTTP requests and responses
+BINARY_CONTENT_TYPE = 'application/vnd.blockchain.v1+octet-stream'
+# Version byte written in front of every encoded block and transaction
+FORMAT_VERSION = 1
+
+_FLAG_INTERNED_KEYS = 1
+_FLAG_FEES = 2
+_FLAG_MERKLE_ROOT = 4
+_TEXT = 0
+_HEX = 1
+_INT = 0
+_FLOAT = 1
+_DOUBLE = struct.Struct('<d')
+
+
+class _Reader:
+    """Reads the fields of an encoded block or transaction one after another."""
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+
+    def read(self, length):
+        if self.pos + length > len(self.data):
+            raise ValueError('Truncated data')
+        chunk = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return bytes(chunk)
+
+    def read_byte(self):
+        return self.read(1)[0]
+
+    def read_varint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.read_byte()
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def read_string(self):
+        tag = self.read_byte()
+        raw = self.read(self.read_varint())
+        if tag == _HEX:
+            return raw.hex()
+        if tag == _TEXT:
+            return raw.decode('utf8')
+        raise ValueError('Unknown string tag {}'.format(tag))
+
+    def read_number(self):
+        tag = self.read_byte()
+        if tag == _INT:
+            zigzag = self.read_varint()
+            return (zigzag >> 1) ^ -(zigzag & 1)
+        if tag == _FLOAT:
+            return _DOUBLE.unpack(self.read(_DOUBLE.size))[0]
+        raise ValueError('Unknown number tag {}'.format(tag))
+
+    def read_version(self):
+        version = self.read_byte()
+        if version != FORMAT_VERSION:
+            raise ValueError('Unsupported format version {}'.format(version))
+
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError('Negative length or index')
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _write_string(out, value):
+    if not isinstance(value, str):
+        raise TypeError('Expected a string, got {!r}'.format(value))
+    try:
+        raw = bytes.fromhex(value)
+        # Only strings which come back unchanged are stored as raw bytes (e.g. not uppercase hex)
+        tag = _HEX if raw.hex() == value else _TEXT
+    except ValueError:
+        tag = _TEXT
+    if tag == _TEXT:
+        raw = value.encode('utf8')
+    out.append(tag)
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _write_number(out, value):
+    if isinstance(value, int):
+        out.append(_INT)
+        # zigzag encoding keeps small negative numbers short
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    else:
+        raise TypeError('Expected a number, got {!r}'.format(value))
+
+
+def encode_transaction(transaction):
+    """Encode a transaction as bytes."""
+    out = bytearray([FORMAT_VERSION])
+    _write_string(out, transaction.sender)
+    _write_string(out, transaction.recipient)
+    _write_number(out, transaction.amount)
+    _write_string(out, transaction.signature)
+    if transaction.fee:
+        _write_number(out, transaction.fee)
+    return bytes(out)
+
+
+def decode_transaction(data):
+    """Decode a transaction encoded by encode_transaction."""
+    reader = _Reader(data)
+    reader.read_version()
+    sender = reader.read_string()
+    recipient = reader.read_string()
+    amount = reader.read_number()
+    signature = reader.read_string()
+    fee = reader.read_number() if reader.pos < len(data) else 0
+    return Transaction(sender, recipient, signature, amount, fee)
+
+
+def encode_block(block, intern_keys=True):
+    """Encode a block and its transactions as bytes.
+
+    Arguments:
+        :block: The block which should be encoded.
+        :intern_keys: Whether senders and recipients are written once per block in a key table.
+    """
+    has_fees = any(tx.fee for tx in block.transactions)
+    flags = (_FLAG_INTERNED_KEYS if intern_keys else 0) | (_FLAG_FEES if has_fees else 0)
+    if block.version >= 2:
+        flags |= _FLAG_MERKLE_ROOT
+    out = bytearray([FORMAT_VERSION, flags])
+    _write_varint(out, block.index)
+    _write_string(out, block.previous_hash)
+    _write_number(out, block.timestamp)
+    _write_number(out, block.proof)
+    _write_varint(out, block.difficulty)
+    if block.version >= 2:
+        _write_varint(out, block.version)
+        _write_string(out, block.merkle_root)
+    if intern_keys:
+        keys = {}
+        for tx in block.transactions:
+            keys.setdefault(tx.sender, len(keys))
+            keys.setdefault(tx.recipient, len(keys))
+        _write_varint(out, len(keys))
+        for key in keys:
+            _write_string(out, key)
+    _write_varint(out, len(block.transactions))
+    for tx in block.transactions:
+        if intern_keys:
+            _write_varint(out, keys[tx.sender])
+            _write_varint(out, keys[tx.recipient])
+        else:
+            _write_string(out, tx.sender)
+            _write_string(out, tx.recipient)
+        _write_number(out, tx.amount)
+        _write_string(out, tx.signature)
+        if has_fees:
+            _write_number(out, tx.fee)
+    return bytes(out)
+
+
+def decode_block(data):
+    """Decode a block encoded by encode_block."""
+    reader = _Reader(data)
+    reader.read_version()
+    flags = reader.read_byte()
+    index = reader.read_varint()
+    previous_hash = reader.read_string()
+    timestamp = reader.read_number()
+    proof = reader.read_number()
+    difficulty = reader.read_varint()
+    if not valid_difficulty(difficulty):
+        raise ValueError('Invalid difficulty {}'.format(difficulty))
+    block_version = 1
+    merkle_root = None
+    if flags & _FLAG_MERKLE_ROOT:
+        block_version = reader.read_varint()
+        merkle_root = reader.read_string()
+    keys = None
+    if flags & _FLAG_INTERNED_KEYS:
+        keys = [reader.read_string() for _ in range(reader.read_varint())]
+    transactions = []
+    for _ in range(reader.read_varint()):
+        if keys is not None:
+            try:
+                sender = keys[reader.read_varint()]
+                recipient = keys[reader.read_varint()]
+            except IndexError:
+                raise ValueError('Unknown key reference')
+        else:
+            sender = reader.read_string()
+            recipient = reader.read_string()
+        amount = reader.read_number()
+        signature = reader.read_string()
+        fee = reader.read_number() if flags & _FLAG_FEES else 0
+        transactions.append(Transaction(sender, recipient, signature, amount, fee))
+    return Block(index, previous_hash, transactions, proof, timestamp, difficulty, block_version, merkle_root)
+
+
+def decode_stored_block(data):
+    """Decode a record of the block store, which is either encoded by encode_block or a JSON line of older versions.
+
+    Only records read from the local store are accepted as JSON, blocks received from peer nodes have to be binary
+    (see decode_block).
+    """
+    if data[:1] != b'{':
+        return decode_block(data)
+    return Block.from_dict(json.loads(bytes(data).decode('utf8')))
+
+
+def encode_blocks(blocks):
+    """Encode a sequence of blocks, yielding one length prefixed record per block (suitable for streaming)."""
+    for block in blocks:
+        record = encode_block(block)
+        prefix = bytearray()
+        _write_varint(prefix, len(record))
+        yield bytes(prefix) + record
+
+
+def _read_records(data):
+    """Yield the length prefixed records of concatenated data one after another."""
+    reader = _Reader(data)
+    while reader.pos < len(data):
+        yield reader.read(reader.read_varint())
+
+
+def decode_blocks(data):
+    """Decode the concatenated records produced by encode_blocks."""
+    return [decode_block(record) for record in _read_records(data)]
+
+
+def encode_transactions(transactions):
+    """Encode a list of transactions as concatenated length prefixed records."""
+    out = bytearray()
+    for tx in transactions:
+        record = encode_transaction(tx)
+        _write_varint(out, len(record))
+        out += record
+    return bytes(out)
+
+
+def decode_transactions(data):
+    """Decode the concatenated records produced by encode_transactions."""
+    return [decode_transaction(record) for record in _read_records(data)]
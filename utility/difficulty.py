@@ -0,0 +1,123 @@
+"""Provides the mining difficulty, its adjustment towards a target block time and the rules for block timestamps
+the adjustment relies on."""
+
+import math
+import statistics
+import time
+
+
+# Number of leading zero bits of a valid proof of work hash for the first blocks (two leading 0s in hex)
+DEFAULT_DIFFICULTY = 8
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 64
+# Seconds the network aims to take between two blocks
+TARGET_BLOCK_TIME = 60
+# Number of blocks after which the difficulty is recalculated
+RETARGET_INTERVAL = 10
+# Maximum number of bits the difficulty may change by at once
+MAX_ADJUSTMENT = 2
+# Number of previous blocks whose median timestamp the timestamp of a new block has to be later than
+MEDIAN_TIME_SPAN = 11
+# Seconds the timestamp of a block may be ahead of the local clock
+MAX_FUTURE_DRIFT = 2 * 60 * 60
+# Number of blocks in front of a block its difficulty and timestamp are checked against
+VALIDATION_WINDOW = max(RETARGET_INTERVAL + 1, MEDIAN_TIME_SPAN)
+
+
+def valid_difficulty(difficulty):
+    """Return True if a difficulty is an integer between MIN_DIFFICULTY and MAX_DIFFICULTY.
+
+    Difficulties of peer blocks are checked when the blocks are decoded, since chain_work and the proof of work
+    compute with them before the blocks are verified.
+    """
+    return isinstance(difficulty, int) and not isinstance(difficulty, bool) and MIN_DIFFICULTY <= difficulty <= MAX_DIFFICULTY
+
+
+def _mined_by_older_version(block):
+    """Return True if a block looks like it was mined by an older version (version 1 at the fixed default difficulty)."""
+    return block.version < 2 and block.difficulty == DEFAULT_DIFFICULTY
+
+
+def follows_legacy_rules(chain, block, height=None):
+    """Return True if a block was mined by an older version and is exempt from retargeting and the median time rule.
+
+    Older versions mined every block at DEFAULT_DIFFICULTY and gave all blocks mined by one process the same
+    timestamp, so timestamps of blocks mined by several nodes repeat or run backwards. Only a version 1 block at the
+    default difficulty whose previous block is one as well counts, and block versions never decrease along a chain,
+    so once a chain contains a version 2 block every block after it follows the rules.
+
+    Arguments:
+        :chain: The blocks the block is appended to.
+        :block: The block which is checked.
+        :height: Only consider the first height blocks of the chain (defaults to the whole chain).
+    """
+    if height is None:
+        height = len(chain)
+    return _mined_by_older_version(block) and _mined_by_older_version(chain[height - 1])
+
+
+def next_difficulty(chain, block_time=TARGET_BLOCK_TIME, retarget_interval=RETARGET_INTERVAL, height=None):
+    """Return the difficulty the block following the given chain must be mined with.
+
+    Every retarget_interval blocks the time the last retarget_interval blocks took is compared to the time they
+    should have taken. Every additional bit doubles the expected mining work, so the difficulty changes by the
+    (rounded, bounded) base 2 logarithm of that ratio.
+
+    Arguments:
+        :chain: The blocks the next block is appended to.
+        :block_time: The targeted number of seconds between two blocks.
+        :retarget_interval: The number of blocks between two difficulty adjustments.
+        :height: Only consider the first height blocks of the chain (defaults to the whole chain).
+    """
+    if height is None:
+        height = len(chain)
+    last_block = chain[height - 1]
+    # The genesis block carries no meaningful timestamp and is never part of a window
+    if height <= retarget_interval + 1 or (height - 1) % retarget_interval != 0:
+        return last_block.difficulty
+    # Windows starting at a block of an older version are not retargeted, their timestamps say nothing about the work
+    if _mined_by_older_version(chain[height - 1 - retarget_interval]):
+        return last_block.difficulty
+    actual_time = last_block.timestamp - chain[height - 1 - retarget_interval].timestamp
+    expected_time = block_time * retarget_interval
+    if actual_time <= 0:
+        adjustment = MAX_ADJUSTMENT
+    else:
+        adjustment = round(math.log2(expected_time / actual_time))
+        adjustment = max(-MAX_ADJUSTMENT, min(MAX_ADJUSTMENT, adjustment))
+    return max(MIN_DIFFICULTY, min(MAX_DIFFICULTY, last_block.difficulty + adjustment))
+
+
+def median_time_past(chain, height=None, span=MEDIAN_TIME_SPAN):
+    """Return the median timestamp of the last span blocks of the chain (or of its first height blocks)."""
+    if height is None:
+        height = len(chain)
+    return statistics.median(chain[index].timestamp for index in range(max(0, height - span), height))
+
+
+def valid_timestamp(chain, block, height=None, now=None):
+    """Return True if the timestamp of a block allows it to follow the given chain.
+
+    The timestamp has to be later than the median of the previous blocks (so timestamps can not run backwards,
+    which would make the retargeting lower the difficulty) and may be at most MAX_FUTURE_DRIFT seconds ahead of now.
+    Blocks of older versions (see follows_legacy_rules) only have to meet the second rule.
+
+    Arguments:
+        :chain: The blocks the block is appended to.
+        :block: The block whose timestamp is checked.
+        :height: Only consider the first height blocks of the chain (defaults to the whole chain).
+        :now: The current time (defaults to the local clock).
+    """
+    timestamp = block.timestamp
+    if not isinstance(timestamp, (int, float)):
+        return False
+    if now is None:
+        now = time.time()
+    if not follows_legacy_rules(chain, block, height) and timestamp <= median_time_past(chain, height):
+        return False
+    return timestamp <= now + MAX_FUTURE_DRIFT
+
+
+def chain_work(blocks):
+    """Return the expected number of hashes it took to mine the blocks (every bit of difficulty doubles the work)."""
+    return sum(2 ** block.difficulty for block in blocks)
@@ -1,5 +1,6 @@
 import json
 import hashlib
+from utility.difficulty import DEFAULT_DIFFICULTY
 
 
 def hash_string_256(string):
@@ -16,6 +17,57 @@ def hash_block(block):
     Arguments:
         :block: The block that should be hashed
     """
-    hashable_block = block.__dict__.copy()
-    hashable_block['transactions'] = [tx.to_ordered_dict() for tx in hashable_block['transactions']]
-    return hash_string_256(json.dumps(hashable_block, sort_keys=True).encode())
\ No newline at end of file
+    if block.version >= 2:
+        # The same hash as the proof of work, which covers the transactions through the Merkle root of the header
+        return hash_string_256(block.header_prefix() + str(block.proof).encode())
+    hashable_block = {
+        'index': block.index,
+        'previous_hash': block.previous_hash,
+        'timestamp': block.timestamp,
+        'proof': block.proof
+    }
+    # Blocks which were mined before the difficulty was stored per block have the default difficulty and were hashed
+    # without it, so it is only part of the hash if it differs (otherwise their hashes would change)
+    if block.difficulty != DEFAULT_DIFFICULTY:
+        hashable_block['difficulty'] = block.difficulty
+    # 'transactions' sorts after all other keys, so the JSON of the transactions is appended at the end
+    # (the result is the same as dumping the whole block with sort_keys)
+    header = json.dumps(hashable_block, sort_keys=True)
+    transactions = '[' + ', '.join(tx.hash_content() for tx in block.transactions) + ']'
+    return hash_string_256((header[:-1] + ', "transactions": ' + transactions + '}').encode())
+
+class ProofHasher:
+    """Hashes proof of work guesses for one block.
+
+    The constant part of the input (transactions and previous hash) is fed into a SHA256 object once; every guess
+    only copies that state and hashes the proof number. A guess is valid if its raw digest, read as a big endian
+    number, does not exceed the target for the difficulty.
+
+    Attributes:
+        :difficulty: The number of leading zero bits a valid digest needs.
+    """
+    def __init__(self, prefix, difficulty=8):
+        self.difficulty = difficulty
+        self.__midstate = hashlib.sha256(prefix)
+        self.__target = ((1 << (256 - difficulty)) - 1).to_bytes(32, 'big')
+
+    def digest(self, proof):
+        """Return the raw digest for a proof number."""
+        guess = self.__midstate.copy()
+        guess.update(str(proof).encode())
+        return guess.digest()
+
+    def check(self, proof):
+        """Return True if the proof number solves the puzzle."""
+        return self.digest(proof) <= self.__target
+
+    def search(self, start, count):
+        """Try the proof numbers start, start + 1, ... start + count - 1 and return the first valid one (or None)."""
+        midstate_copy = self.__midstate.copy
+        target = self.__target
+        for proof in range(start, start + count):
+            guess = midstate_copy()
+            guess.update(str(proof).encode())
+            if guess.digest() <= target:
+                return proof
+        return None
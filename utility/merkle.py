@@ -0,0 +1,91 @@
+"""Provides Merkle trees over transaction ids, so a block can commit to its transactions with a single hash.
+
+The leaves are the hashes of the transaction ids (see Transaction.id) behind a leaf marker byte. Two neighbouring
+nodes are combined by hashing a different marker byte followed by both raw digests, so a combined node can not be
+passed off as a leaf (or a leaf as a combined node) in a proof. A node without a neighbour (the last one on a level
+with an odd number of nodes) moves up unchanged instead of being paired with a copy of itself, which would give a list
+with a repeated last transaction the same root.
+"""
+
+import hashlib
+
+
+# Root of a block without transactions
+EMPTY_ROOT = hashlib.sha256(b'').hexdigest()
+# Marks leaves and combined nodes, so they can not be confused with each other
+_LEAF_MARKER = b'\x00'
+_NODE_MARKER = b'\x01'
+
+
+def _leaf(tx_id):
+    return hashlib.sha256(_LEAF_MARKER + bytes.fromhex(tx_id)).digest()
+
+
+def _combine(left, right):
+    return hashlib.sha256(_NODE_MARKER + left + right).digest()
+
+
+def _next_level(level):
+    combined = [_combine(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        combined.append(level[-1])
+    return combined
+
+
+def merkle_root(tx_ids):
+    """Return the Merkle root over a list of transaction ids (as hex).
+
+    Arguments:
+        :tx_ids: The ids of the transactions of a block in the order of the block.
+    """
+    if not tx_ids:
+        return EMPTY_ROOT
+    level = [_leaf(tx_id) for tx_id in tx_ids]
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0].hex()
+
+
+def merkle_proof(tx_ids, position):
+    """Return the hashes which lead from the transaction at a position to the Merkle root.
+
+    Every step is a dictionary with the hash of the neighbouring node and the side it is on ('left' or 'right').
+
+    Arguments:
+        :tx_ids: The ids of the transactions of a block in the order of the block.
+        :position: The position of the transaction in the block.
+    """
+    if not 0 <= position < len(tx_ids):
+        raise IndexError('No transaction at position {}'.format(position))
+    proof = []
+    level = [_leaf(tx_id) for tx_id in tx_ids]
+    while len(level) > 1:
+        neighbour = position ^ 1
+        if neighbour < len(level):
+            proof.append({'hash': level[neighbour].hex(), 'side': 'left' if neighbour < position else 'right'})
+        level = _next_level(level)
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(tx_id, proof, root):
+    """Return True if a proof (see merkle_proof) shows that a transaction id is part of the tree with a root.
+
+    Arguments:
+        :tx_id: The id of the transaction.
+        :proof: The steps from the transaction to the root.
+        :root: The Merkle root of the block (e.g. from its header).
+    """
+    try:
+        node = _leaf(tx_id)
+        for step in proof:
+            neighbour = bytes.fromhex(step['hash'])
+            if step['side'] == 'left':
+                node = _combine(neighbour, node)
+            elif step['side'] == 'right':
+                node = _combine(node, neighbour)
+            else:
+                return False
+    except (ValueError, TypeError, KeyError):
+        return False
+    return node.hex() == root
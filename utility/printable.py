@@ -1,4 +1,7 @@
 class Printable:
-    """A base class which implements printing functionality."""
+    """A base class which implements printing functionality for classes which declare their fields in __slots__."""
+    __slots__ = ()
+
     def __repr__(self):
-        return str(self.__dict__)
+        # Private slots (e.g. memoized values) are not part of the printed fields
+        return str({name: getattr(self, name) for name in self.__slots__ if not name.startswith('_')})
@@ -0,0 +1,77 @@
+"""Provides a lock which lets many threads read shared state at the same time."""
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """A lock which can be held by many reading threads or by a single writing thread.
+
+    Writers which are waiting are preferred over new readers, so a steady stream of readers can not starve them.
+    Both the read and the write lock are reentrant, and the writing thread may read as well. A reading thread can
+    not upgrade to the write lock (it would wait for itself).
+
+    Attributes:
+        :condition (private): Guards the counters below and wakes up waiting threads.
+        :readers (private): The number of threads holding the read lock.
+        :writer (private): The id of the thread holding the write lock (or None).
+        :waiting_writers (private): The number of threads waiting for the write lock.
+        :local (private): How often the current thread acquired the read lock.
+    """
+    def __init__(self):
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__writer = None
+        self.__waiting_writers = 0
+        self.__local = threading.local()
+
+    @contextmanager
+    def read(self):
+        """Hold the read lock for the duration of a with block."""
+        depth = getattr(self.__local, 'depth', 0)
+        if depth or self.__writer == threading.get_ident():
+            # Already reading or writing, so nothing can change in between
+            self.__local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self.__local.depth = depth
+            return
+        with self.__condition:
+            while self.__writer is not None or self.__waiting_writers:
+                self.__condition.wait()
+            self.__readers += 1
+        self.__local.depth = 1
+        try:
+            yield
+        finally:
+            self.__local.depth = 0
+            with self.__condition:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Hold the write lock for the duration of a with block."""
+        thread_id = threading.get_ident()
+        if self.__writer == thread_id:
+            # The outermost with block releases the lock
+            yield
+            return
+        if getattr(self.__local, 'depth', 0):
+            raise RuntimeError('The read lock can not be upgraded to the write lock')
+        with self.__condition:
+            self.__waiting_writers += 1
+            try:
+                while self.__writer is not None or self.__readers:
+                    self.__condition.wait()
+            finally:
+                self.__waiting_writers -= 1
+            self.__writer = thread_id
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__writer = None
+                self.__condition.notify_all()
@@ -1,51 +1,215 @@
 """Provides verification helper methods."""
 
-from utility.hash_util import hash_string_256, hash_block
-from wallet import Wallet
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+from utility.hash_util import ProofHasher
+from utility.difficulty import DEFAULT_DIFFICULTY, TARGET_BLOCK_TIME, next_difficulty, valid_timestamp, follows_legacy_rules
+from wallet import Wallet, SignatureCache
+
+
+# Reward given to miners for creating a new block (the fees of the block are added to it)
+MINING_REWARD = 10
+# Batches with fewer unverified signatures than this are checked on the calling process
+BATCH_THRESHOLD = 16
+# Number of signatures a pool worker checks per task
+BATCH_CHUNK_SIZE = 32
+# The server is multi-threaded, so pool workers are started fresh instead of being forked from it. A forked worker
+# would inherit locks (e.g. of the signature cache) which another thread held at that moment and wait for them forever.
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_executor = None
+
+
+def _get_executor():
+    """Return the process pool used for signature verification (started on first use)."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=multiprocessing.cpu_count(),
+                                        mp_context=multiprocessing.get_context(POOL_START_METHOD))
+    return _executor
+
+
+def _verify_signatures(transactions):
+    """Verify the signatures of a chunk of transactions, stopping at the first invalid one."""
+    try:
+        return all(Wallet.verify_transaction(tx) for tx in transactions)
+    except (ValueError, TypeError, IndexError):
+        # Malformed keys or signatures (e.g. from a peer's chain) are invalid, not fatal
+        return False
+
+
+def _check_signatures(transactions):
+    """Verify the signatures of a chunk of transactions and return whether each one of them is valid."""
+    results = []
+    for tx in transactions:
+        try:
+            results.append(Wallet.verify_transaction(tx))
+        except (ValueError, TypeError, IndexError):
+            results.append(False)
+    return results
+
 
 class Verification:
     """A helper class which offers various static and class-based verification and validation methods"""
 
     @staticmethod
-    def valid_proof(transactions, last_hash, proof):
-        """Validate a proof of work number and see if it solves the puzzle algorithm (two leading 0s)
+    def proof_prefix(transactions, last_hash):
+        """Serialize the part of the proof of work input which stays the same for every proof number.
+
+        Arguments:
+            :transactions: The Transactions of the block for which the proof is created.
+            :last_hash: The previous block's hash which will be stored in the current block."""
+        # Same text as str() of the list of ordered dicts, joined from the text of every transaction
+        return ('[' + ', '.join(tx.proof_content() for tx in transactions) + ']' + str(last_hash)).encode()
+
+    @staticmethod
+    def valid_proof_prefix(prefix, proof, difficulty=DEFAULT_DIFFICULTY):
+        """Validate a proof of work number against an already serialized prefix (see proof_prefix)."""
+        # NOTE: This is a different hash stored in the previous hash. Only used for proof of work algorithms.
+        # Only a hash (based on the above inputs) which starts with difficulty zero bits is treated as valid.
+        return ProofHasher(prefix, difficulty).check(proof)
+
+    @classmethod
+    def valid_proof(cls, transactions, last_hash, proof, difficulty=DEFAULT_DIFFICULTY):
+        """Validate a proof of work number and see if it solves the puzzle algorithm (difficulty leading zero bits)
         
         Arguments:
             :transactions: The Transactions of the block for which the proof is created.
             :last_hash: The previous block's hash which will be stored in the current block.
-            : proof: The proof number tested."""
-        # Create a string with all the hash inputs
-        guess = (str([tx.to_ordered_dict() for tx in transactions]) + str(last_hash) +str(proof)).encode()
-        # Hash string
-        # NOTE: This is a different hash stored in the previous hash. Only used for proof of work algorithms.
-        guess_hash = hash_string_256(guess)
-        # Only a hash (based on the above inputs) which starts with two 0s is treated as valid.
-        # Check if hash fulfills condition
-        return guess_hash[0:2] == '00'
+            : proof: The proof number tested.
+            :difficulty: The number of leading zero bits the hash needs."""
+        return cls.valid_proof_prefix(cls.proof_prefix(transactions, last_hash), proof, difficulty)
+
+    @classmethod
+    def block_proof_prefix(cls, block):
+        """Return the proof of work prefix of a block: its header for version 2 blocks, otherwise its transactions
+        (except the reward transaction) and the previous hash."""
+        if block.version >= 2:
+            return block.header_prefix()
+        return cls.proof_prefix(block.transactions[:-1], block.previous_hash)
+
+    @classmethod
+    def valid_block_proof(cls, block):
+        """Validate the proof of work number of a block."""
+        return cls.valid_proof_prefix(cls.block_proof_prefix(block), block.proof, block.difficulty)
+
+    @staticmethod
+    def valid_merkle_root(block):
+        """Return True if the Merkle root of a block matches its transactions (version 1 blocks have none)."""
+        return block.version < 2 or block.merkle_root == block.compute_merkle_root()
     
+    @staticmethod
+    def valid_reward(block):
+        """Return True if the last transaction of a block rewards its miner with MINING_REWARD plus the fees of the
+        other transactions.
+
+        The reward of a version 2 block carries the block index in place of a signature (see Blockchain.mine_block).
+        """
+        if not block.transactions:
+            return False
+        reward = block.transactions[-1]
+        if block.version >= 2 and reward.signature != str(block.index):
+            return False
+        try:
+            # Summed in the same order as when the block was mined, so the floats match exactly
+            fees = sum(tx.fee for tx in block.transactions[:-1])
+            return reward.sender == 'MINING' and not reward.fee and reward.amount == MINING_REWARD + fees
+        except TypeError:
+            return False
+
+    @staticmethod
+    def valid_block_size(block, template):
+        """Return True if the transactions of a block (except the reward transaction) are within the limits of a
+        template (see TemplateBuilder.exceeds_limits)."""
+        try:
+            return not template.exceeds_limits(block.transactions[:-1])
+        except TypeError:
+            return False
+
+    @staticmethod
+    def checkpoint_height(blockchain, checkpoints):
+        """Return the height of the highest checkpoint a chain contains (0 if it contains none).
+
+        Returns None if a block of the chain has a different hash than the checkpoint at its height.
+
+        Arguments:
+            :blockchain: The blocks which should be checked.
+            :checkpoints: Mapping of height to the trusted hash of the block at that height.
+        """
+        trusted_height = 0
+        for height, block_hash in (checkpoints or {}).items():
+            if height >= len(blockchain):
+                continue
+            if blockchain[height].hash != block_hash:
+                return None
+            trusted_height = max(trusted_height, height)
+        return trusted_height
+
     @classmethod
-    def verify_chain(cls, blockchain):
-        """Verify the current blockchain and return True if its valid, False otherwise."""
-        for index, block in enumerate(blockchain):
-            if index == 0: # Dont need to validate the genesis block
-                continue 
-            if block.previous_hash != hash_block(blockchain[index -1]):
-                return False
-            if not cls.valid_proof(block.transactions[:-1], block.previous_hash, block.proof):
+    def verify_chain(cls, blockchain, block_time=TARGET_BLOCK_TIME, start=1, checkpoints=None, template=None):
+        """Verify the current blockchain and return True if its valid, False otherwise.
+
+        Arguments:
+            :blockchain: The blocks which should be verified.
+            :block_time: The targeted number of seconds between two blocks.
+            :start: The index of the first block to verify (the blocks before it are trusted).
+            :checkpoints: Mapping of height to the trusted hash of the block at that height. The proof of work and
+                signatures of the blocks up to the highest checkpoint are not checked again, only how they are linked
+                and whether their transactions match their Merkle root.
+            :template: The TemplateBuilder whose size limits the blocks have to keep (not checked if it is None).
+        """
+        start = max(start, 1) # Dont need to validate the genesis block
+        trusted_height = cls.checkpoint_height(blockchain, checkpoints)
+        if trusted_height is None:
+            print('Checkpoint does not match')
+            return False
+        for index in range(start, len(blockchain)):
+            block = blockchain[index]
+            if block.index != index:
+                return False
+            if block.previous_hash != blockchain[index -1].hash:
+                return False
+            if block.version < blockchain[index - 1].version:
+                print('Block version is invalid')
+                return False
+            # Blocks of older versions were all mined at the default difficulty
+            if not follows_legacy_rules(blockchain, block, height=index) \
+                    and block.difficulty != next_difficulty(blockchain, block_time, height=index):
+                print('Difficulty is invalid')
+                return False
+            if not valid_timestamp(blockchain, block, height=index):
+                print('Timestamp is invalid')
+                return False
+            if not cls.valid_reward(block):
+                print('Mining reward is invalid')
+                return False
+            if template is not None and not cls.valid_block_size(block, template):
+                print('Block is too large')
+                return False
+            # A version 2 block hash only covers the header, so even trusted blocks have to match their transactions
+            if not cls.valid_merkle_root(block):
+                print('Merkle root is invalid')
+                return False
+            if index > trusted_height and not cls.valid_block_proof(block):
                 print('Proof of work is invalid')
                 return False
+        # Signatures are the most expensive check, so all of them (except of the reward transactions) are checked in
+        # one batch once every block passed the checks above
+        if not cls.verify_transactions_batch([tx for block in blockchain[max(start, trusted_height + 1):] for tx in block.transactions[:-1]]):
+            print('Signature is invalid')
+            return False
         return True
     
     @staticmethod
     def verify_transaction(transaction, get_balance, check_funds=True):
-        """Verify a transaction by checking whether the sender has sufficient coins.
+        """Verify a transaction by checking whether the sender has sufficient coins (for the amount and the fee).
         
         Arguments:
             :transaction: The transaction that should be verified.
         """
         if check_funds:
             sender_balance = get_balance(transaction.sender)
-            return sender_balance >= transaction.amount and Wallet.verify_transaction(transaction)
+            return sender_balance >= transaction.cost and Wallet.verify_transaction(transaction)
         else:
             return Wallet.verify_transaction(transaction)
 
@@ -53,5 +217,64 @@ class Verification:
     def verify_transactions(cls, open_transactions, get_balance):
         """Check if all open transactions are valid"""
         return all([cls.verify_transaction(tx, get_balance, False) for tx in open_transactions]) # check if all open transactions are valid
-    
 
+    @staticmethod
+    def verify_transactions_batch(transactions):
+        """Verify the signatures of many transactions and return True if all of them are valid.
+
+        Signatures which were verified before are taken from the signature cache. If enough signatures remain,
+        they are checked in chunks on a process pool and the check stops as soon as one chunk fails.
+
+        Arguments:
+            :transactions: The transactions whose signatures should be verified.
+        """
+        pending = []
+        for tx in transactions:
+            key = SignatureCache.key(tx)
+            if not Wallet.signature_cache.lookup(key):
+                pending.append((key, tx))
+        if len(pending) < BATCH_THRESHOLD:
+            return _verify_signatures([tx for key, tx in pending])
+        executor = _get_executor()
+        futures = {}
+        for start in range(0, len(pending), BATCH_CHUNK_SIZE):
+            chunk = pending[start:start + BATCH_CHUNK_SIZE]
+            futures[executor.submit(_verify_signatures, [tx for key, tx in chunk])] = chunk
+        for future in as_completed(futures):
+            if not future.result():
+                for other in futures:
+                    other.cancel()
+                return False
+            # The workers have their own caches, so verified signatures are remembered here as well
+            for key, tx in futures[future]:
+                Wallet.signature_cache.add(key)
+        return True
+
+    @staticmethod
+    def verify_signatures(transactions):
+        """Verify the signatures of many transactions and return whether each one of them is valid.
+
+        Unlike verify_transactions_batch every transaction is checked (e.g. to answer a batch of submitted
+        transactions one by one), using the signature cache and the process pool in the same way.
+
+        Arguments:
+            :transactions: The transactions whose signatures should be verified.
+        """
+        results = [True] * len(transactions)
+        pending = []
+        for position, tx in enumerate(transactions):
+            key = SignatureCache.key(tx)
+            if not Wallet.signature_cache.lookup(key):
+                pending.append((position, key, tx))
+        if len(pending) < BATCH_THRESHOLD:
+            checked = _check_signatures([tx for position, key, tx in pending])
+        else:
+            executor = _get_executor()
+            futures = [executor.submit(_check_signatures, [tx for position, key, tx in pending[start:start + BATCH_CHUNK_SIZE]])
+                       for start in range(0, len(pending), BATCH_CHUNK_SIZE)]
+            checked = [valid for future in futures for valid in future.result()]
+        for (position, key, tx), valid in zip(pending, checked):
+            results[position] = valid
+            if valid:
+                Wallet.signature_cache.add(key)
+        return results
@@ -3,9 +3,82 @@ from Crypto.Signature import PKCS1_v1_5
 from Crypto.Hash import SHA256
 import Crypto.Random
 import binascii
+import functools
+import threading
+from collections import OrderedDict
+from transaction import Transaction
+
+
+# Maximum number of verified signatures remembered by the signature cache
+SIGNATURE_CACHE_SIZE = 100000
+# Maximum number of parsed public keys kept in memory
+KEY_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=KEY_CACHE_SIZE)
+def import_public_key(public_key):
+    """Parse a hex encoded DER public key (cached per key, since every sender signs many transactions)."""
+    return RSA.importKey(binascii.unhexlify(public_key))
+
+
+class SignatureCache:
+    """A bounded, least recently used cache of transactions whose signature was verified successfully.
+
+    Attributes:
+        :max_size: The maximum number of remembered transactions.
+        :hits: The number of lookups which found a verified transaction.
+        :misses: The number of lookups which did not.
+    """
+    def __init__(self, max_size=SIGNATURE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def key(transaction):
+        """Return the digest identifying the signed content and the signature of a transaction (its id)."""
+        return transaction.id
+
+    def lookup(self, key):
+        """Return True if the transaction with this key was verified before."""
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        """Remember a verified transaction, evicting the least recently used one if the cache is full."""
+        with self.__lock:
+            self.__entries[key] = True
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        """Forget all verified transactions and reset the counters."""
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Return the size and hit/miss counters of the cache."""
+        return {'size': len(self.__entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
 
 class Wallet:
-    """Creates, loads and holds private and public keys. Manages transaction signing and verification."""
+    """Creates, loads and holds private and public keys. Manages transaction signing and verification.
+
+    Attributes:
+        :signature_cache: The transactions verified by this node (shared by all wallets).
+    """
+    signature_cache = SignatureCache()
+
     def __init__(self, node_id):
         self.private_key = None
         self.public_key = None
@@ -51,26 +124,43 @@ class Wallet:
         public_key = private_key.publickey() # in binary
         return binascii.hexlify(private_key.exportKey(format='DER')).decode('ascii'), binascii.hexlify(public_key.exportKey(format='DER')).decode('ascii') # convert from binary to ascii
 
-    def sign_transaction(self, sender, recipient ,amount):
+    def sign_transaction(self, sender, recipient ,amount, fee=0):
         """Sign a transaction and return the signature.
         Arguments:
             :sender: The sender of the transaction.
             :recipient: The recipient of the transaction.
             :amount: The amount in the transaction.
+            :fee: The fee paid to the miner (default = 0).
         """
         signer = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(self.private_key))) # creating a signer identity
-        h = SHA256.new((str(sender)+ str(recipient)+str(amount)).encode('utf8')) # create a hash
+        h = SHA256.new(Transaction(sender, recipient, None, amount, fee).signed_content().encode('utf8')) # create a hash
         signature = signer.sign(h)
         return binascii.hexlify(signature).decode('ascii') #return a string that contains the signature/ created when new transaction occurs
     
-    @staticmethod
-    def verify_transaction(transaction):
+    @classmethod
+    def verify_transaction(cls, transaction):
         """Verify the signature of a transaction.
         Arguments:
             :transaction: The transaction that should be verified.
         """
-        public_key = RSA.importKey(binascii.unhexlify(transaction.sender))
+        # Each signature only has to be verified once, the same transaction is checked again when mining or receiving it
+        key = SignatureCache.key(transaction)
+        if cls.signature_cache.lookup(key):
+            return True
+        public_key = import_public_key(transaction.sender)
         verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(transaction.sender)+ str(transaction.recipient)+str(transaction.amount)).encode('utf8')) # create a hash
-        return verifier.verify(h, binascii.unhexlify(transaction.signature))
+        h = SHA256.new(transaction.signed_content().encode('utf8')) # create a hash
+        valid = verifier.verify(h, binascii.unhexlify(transaction.signature))
+        if valid:
+            cls.signature_cache.add(key)
+        return valid
+
+    @classmethod
+    def signature_cache_info(cls):
+        """Return the hit/miss counters of the signature cache and of the public key cache."""
+        key_info = import_public_key.cache_info()
+        return {
+            'signatures': cls.signature_cache.info(),
+            'keys': {'size': key_info.currsize, 'max_size': key_info.maxsize, 'hits': key_info.hits, 'misses': key_info.misses}
+        }
         
\ No newline at end of file